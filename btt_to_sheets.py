@@ -5,8 +5,8 @@ import re
 import subprocess
 subprocess.run(["python3", "-m", "pip", "install", "pandas"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 import pandas as pd
+import numpy as np
 from io import StringIO
-import bittensor as bt
 from datetime import datetime, timedelta
 import os
 import time
@@ -14,8 +14,11 @@ import json
 import requests
 from dotenv import load_dotenv
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 from utils.google_sheets import update_google_sheet, check_auth
+from utils.immunity import get_immune_until
+from utils.subtensor_pool import SubtensorPool
 
 # Set up logging
 logging.basicConfig(
@@ -30,6 +33,7 @@ logger = logging.getLogger('btt_to_sheets')
 
 # Constants
 BLOCK_TIME = 12
+METAGRAPH_FETCH_CONCURRENCY = 4  # Subnets fetched in parallel, each over its own connection
 #subtensor_address = "ws://127.0.0.1:9944"
 subtensor_address = "wss://entrypoint-finney.opentensor.ai:443"
 HOTKEYS = os.getenv('HOTKEYS', '').split(',')
@@ -103,10 +107,14 @@ def get_subnet_list_data():
     """Get subnet list information"""
     try:
         # Import this function from the module
-        from utils.subnet_info import get_subnet_info
+        from utils.subnet_info import get_subnet_info, SUBNET_INFO_CONCURRENCY
         
-        # Get subnet info
-        df = get_subnet_info(subtensor_address)
+        # Get subnet info, its bulk reads overlap on a small pool of connections
+        subtensor_pool = SubtensorPool(subtensor_address, size=SUBNET_INFO_CONCURRENCY)
+        try:
+            df = get_subnet_info(subtensor_address, subtensor_pool=subtensor_pool)
+        finally:
+            subtensor_pool.close()
         if df is not None and not df.empty:
             return df
         else:
@@ -133,124 +141,34 @@ def get_metagraph_data(netuids, egrep_keys=None):
     pattern = "|".join(sanitized_egrep_keys)
     logger.info(f"Using pattern: {pattern[:100]}..." if len(pattern) > 100 else f"Using pattern: {pattern}")
 
-    # Initialize subtensor connection
-    subtensor = None
+    # Subnets are fetched concurrently, each worker on its own connection from a small pool
+    subtensor_pool = SubtensorPool(subtensor_address, size=METAGRAPH_FETCH_CONCURRENCY)
     try:
         logger.info(f"Connecting to subtensor at {subtensor_address}")
-        subtensor = bt.subtensor(network=f"{subtensor_address}")
-        current_block = subtensor.get_current_block()
+        with subtensor_pool.connection() as subtensor:
+            current_block = subtensor.get_current_block()
         logger.info(f"Connected to subtensor, current block: {current_block}")
     except Exception as e:
         logger.error(f"Error connecting to subtensor network: {e}")
+        subtensor_pool.close()
         return pd.DataFrame()
 
-    resulting_lines = []  # Initialize outside the loop
+    valid_netuids = []
+    for netuid in netuids:
+        netuid = netuid.strip()  # Remove any leading/trailing whitespace
+        if re.match(r'^\d+$', netuid):
+            valid_netuids.append(int(netuid))
+        else:
+            logger.error(f"Invalid netuid format: {netuid}")
+
+    def fetch(netuid_int):
+        with subtensor_pool.connection() as subtensor:
+            return get_netuid_lines(subtensor, netuid_int, current_block, pattern, sanitized_egrep_keys)
 
     try:
-        for netuid in netuids:
-            netuid = netuid.strip()  # Remove any leading/trailing whitespace
-            if re.match(r'^\d+$', netuid):
-                netuid_int = int(netuid)
-                try:
-                    logger.info(f"Fetching metagraph for netuid {netuid_int}")
-                    metagraph = subtensor.metagraph(netuid=netuid_int)
-                    logger.info(f"Metagraph for netuid {netuid_int} has {len(metagraph.uids)} UIDs")
-                    
-                    # Calculate daily rewards using new formula
-                    # emissions is alpha per 360 blocks, so calculate daily earnings
-                    daily_blocks = (60 * 60 * 24) / BLOCK_TIME  # Number of blocks per day
-                    tempo_multiplier = daily_blocks / metagraph.tempo
-                    
-                    # Get pool info for alpha token price
-                    pool = metagraph.pool
-                    alpha_token_price = pool.tao_in / pool.alpha_in
-                    
-                except Exception as e:
-                    logger.error(f"Error fetching metagraph for netuid {netuid}: {e}")
-                    continue  # Skip to the next netuid
-
-                # Extract the first AxonInfo entry
-                axon_ip, axon_port = None, None
-                if metagraph.axons and len(metagraph.axons) > 0:
-                    first_axon = metagraph.axons[0]
-                    if hasattr(first_axon, 'ip') and hasattr(first_axon, 'port'):
-                        axon_ip = first_axon.ip
-                        axon_port = first_axon.port
-
-                # First get the length of uids for validation
-                n_uids = len(metagraph.uids)
-                
-                data = {
-                    'SUBNET': [netuid_int] * n_uids,  # Repeat subnet for each UID
-                    'UID': metagraph.uids,
-                    'STAKE': metagraph.stake,
-                    'RANK': metagraph.ranks,
-                    'TRUST': metagraph.trust,
-                    'CONSENSUS': metagraph.consensus,
-                    'INCENTIVE': metagraph.incentive,
-                    'DIVIDENDS': metagraph.dividends,
-                    'EMISSION': metagraph.emission,
-                    'VTRUST': metagraph.validator_trust,
-                    'VPERMIT': metagraph.validator_permit,
-                    'UPDATED': metagraph.last_update,
-                    'ACTIVE': metagraph.active,
-                    'AXON': [f"{axon.ip}:{axon.port}" for axon in metagraph.axons[:n_uids]],  # Ensure same length as uids
-                    'HOTKEY': metagraph.hotkeys,
-                    'COLDKEY': metagraph.coldkeys,
-                    'IMMUNE': ['' for _ in range(n_uids)], # empty list of strings
-                    'ALPHA_STAKE': metagraph.alpha_stake,
-                    'TAO_STAKE': metagraph.tao_stake,
-                    'DAILY_REWARDS_ALPHA': [float(emission * tempo_multiplier) for emission in metagraph.emission],
-                    'DAILY_REWARDS_TAO': [float(emission * tempo_multiplier * alpha_token_price) for emission in metagraph.emission]
-                }
-                
-                # Convert the dictionary to a DataFrame
-                netuid_lines = pd.DataFrame(data)
-                
-                # Format numeric columns
-                numeric_columns = ['STAKE', 'RANK', 'TRUST', 'CONSENSUS', 'INCENTIVE', 'DIVIDENDS', 'EMISSION', 'VTRUST', 'DAILY_REWARDS_ALPHA', 'DAILY_REWARDS_TAO']
-                for col in numeric_columns:
-                    if col in netuid_lines.columns:
-                        netuid_lines[col] = netuid_lines[col].apply(lambda x: f"{float(x):.8f}" if pd.notnull(x) else x)
-
-                # Format boolean columns
-                boolean_columns = ['ACTIVE', 'VPERMIT']
-                for col in boolean_columns:
-                    if col in netuid_lines.columns:
-                        netuid_lines[col] = netuid_lines[col].astype(bool)
-
-                # Process each row
-                for index, row in netuid_lines.iterrows():
-                    uid = str(row['UID'])
-
-                    # Apply regex search on uid or other fields as needed
-                    if uid and (re.search(pattern, str(row)) or (not sanitized_egrep_keys)):
-                        try:
-                            block_at_registration = subtensor.query_subtensor("BlockAtRegistration", None, [netuid_int, uid])
-                            # Extract the value from BittensorScaleType
-                            if hasattr(block_at_registration, 'value'):
-                                block_at_registration = block_at_registration.value
-                            else:
-                                block_at_registration = int(str(block_at_registration))
-                                
-                            immune_until = block_at_registration + subtensor.immunity_period(netuid=netuid_int)
-                            immune = immune_until > current_block
-
-                            # Update the DataFrame by adding the immune status
-                            netuid_lines.at[index, 'IMMUNE'] = immune_until if immune else ''
-                        except Exception as e:
-                            logger.error(f"Error processing UID {uid}: {e}")
-                            netuid_lines.at[index, 'IMMUNE'] = ''  # Empty string for errors
-                    else:
-                        # Drop the row if the UID does not match the pattern or is invalid
-                        netuid_lines.drop(index, inplace=True)
-
-                # Append the processed netuid_lines to resulting_lines
-                if not netuid_lines.empty:
-                    resulting_lines.append(netuid_lines)
-            else:
-                logger.error(f"Invalid netuid format: {netuid}")
-                continue  # Skip invalid netuid
+        with ThreadPoolExecutor(max_workers=METAGRAPH_FETCH_CONCURRENCY) as executor:
+            # map() keeps the requested netuid order whichever subnet finishes first
+            resulting_lines = [lines for lines in executor.map(fetch, valid_netuids) if lines is not None and not lines.empty]
 
         if resulting_lines:
             # Concatenate all DataFrames in the list
@@ -263,11 +181,100 @@ def get_metagraph_data(netuids, egrep_keys=None):
         else:
             return pd.DataFrame()
     finally:
-        if subtensor and hasattr(subtensor, 'close'):
-            try:
-                subtensor.close()
-            except:
-                pass  # Ignore any errors during close
+        subtensor_pool.close()
+
+def get_netuid_lines(subtensor, netuid_int, current_block, pattern, sanitized_egrep_keys):
+    """Fetch and process the metagraph rows of one subnet, None if it could not be fetched"""
+    try:
+        logger.info(f"Fetching metagraph for netuid {netuid_int}")
+        metagraph = subtensor.metagraph(netuid=netuid_int)
+        logger.info(f"Metagraph for netuid {netuid_int} has {len(metagraph.uids)} UIDs")
+        
+        # Calculate daily rewards using new formula
+        # emissions is alpha per 360 blocks, so calculate daily earnings
+        daily_blocks = (60 * 60 * 24) / BLOCK_TIME  # Number of blocks per day
+        tempo_multiplier = daily_blocks / metagraph.tempo
+        
+        # Get pool info for alpha token price
+        pool = metagraph.pool
+        alpha_token_price = pool.tao_in / pool.alpha_in
+        
+    except Exception as e:
+        logger.error(f"Error fetching metagraph for netuid {netuid_int}: {e}")
+        return None
+
+    # Extract the first AxonInfo entry
+    axon_ip, axon_port = None, None
+    if metagraph.axons and len(metagraph.axons) > 0:
+        first_axon = metagraph.axons[0]
+        if hasattr(first_axon, 'ip') and hasattr(first_axon, 'port'):
+            axon_ip = first_axon.ip
+            axon_port = first_axon.port
+
+    # First get the length of uids for validation
+    n_uids = len(metagraph.uids)
+    
+    data = {
+        'SUBNET': np.full(n_uids, netuid_int),  # Repeat subnet for each UID
+        'UID': metagraph.uids,
+        'STAKE': metagraph.stake,
+        'RANK': metagraph.ranks,
+        'TRUST': metagraph.trust,
+        'CONSENSUS': metagraph.consensus,
+        'INCENTIVE': metagraph.incentive,
+        'DIVIDENDS': metagraph.dividends,
+        'EMISSION': metagraph.emission,
+        'VTRUST': metagraph.validator_trust,
+        'VPERMIT': metagraph.validator_permit,
+        'UPDATED': metagraph.last_update,
+        'ACTIVE': metagraph.active,
+        'AXON': [f"{axon.ip}:{axon.port}" for axon in metagraph.axons[:n_uids]],  # Ensure same length as uids
+        'HOTKEY': metagraph.hotkeys,
+        'COLDKEY': metagraph.coldkeys,
+        'IMMUNE': ['' for _ in range(n_uids)], # empty list of strings
+        'ALPHA_STAKE': metagraph.alpha_stake,
+        'TAO_STAKE': metagraph.tao_stake,
+        # Whole-column arithmetic in the emission dtype, widened to float64 for output
+        'DAILY_REWARDS_ALPHA': (np.asarray(metagraph.emission) * tempo_multiplier).astype(np.float64),
+        'DAILY_REWARDS_TAO': (np.asarray(metagraph.emission) * tempo_multiplier * alpha_token_price).astype(np.float64)
+    }
+    
+    # Convert the dictionary to a DataFrame
+    netuid_lines = pd.DataFrame(data)
+    
+    # Format numeric columns, one pass over plain floats; NaN (x != x) stays NaN
+    numeric_columns = ['STAKE', 'RANK', 'TRUST', 'CONSENSUS', 'INCENTIVE', 'DIVIDENDS', 'EMISSION', 'VTRUST', 'DAILY_REWARDS_ALPHA', 'DAILY_REWARDS_TAO']
+    format_float = '{:.8f}'.format
+    for col in numeric_columns:
+        if col in netuid_lines.columns:
+            values = netuid_lines[col].to_numpy(dtype=np.float64, na_value=np.nan).tolist()
+            netuid_lines[col] = [format_float(x) if x == x else x for x in values]
+
+    # Format boolean columns
+    boolean_columns = ['ACTIVE', 'VPERMIT']
+    for col in boolean_columns:
+        if col in netuid_lines.columns:
+            netuid_lines[col] = netuid_lines[col].astype(bool)
+
+    # Registration blocks for the whole subnet in one lookup instead of two queries per UID
+    try:
+        immune_until = get_immune_until(subtensor, metagraph, netuid_int, current_block)
+    except Exception as e:
+        logger.error(f"Error reading registration blocks for netuid {netuid_int}: {e}")
+        immune_until = None
+
+    # Add the immune status, empty when not immune or unknown
+    if immune_until is not None:
+        netuid_lines['IMMUNE'] = pd.Series(immune_until).astype(object).where(pd.notna(immune_until), '')
+
+    # Keep rows whose hotkey, coldkey or UID match, as one mask and a single filtered copy
+    if sanitized_egrep_keys:
+        mask = np.zeros(len(netuid_lines), dtype=bool)
+        for col in ('HOTKEY', 'COLDKEY', 'UID'):
+            mask |= netuid_lines[col].astype(str).str.contains(pattern, regex=True).to_numpy(dtype=bool)
+        netuid_lines = netuid_lines[mask]
+
+    return netuid_lines
 
 def get_registrations_data():
     """Get registration information"""
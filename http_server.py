@@ -6,30 +6,99 @@ import re
 import subprocess
 subprocess.run(["python3", "-m", "pip", "install", "pandas"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) # Ensure pandas is installed
 import pandas as pd
-from io import StringIO
-import bittensor as bt
+import numpy as np
+from io import StringIO, BytesIO
+from bittensor.core.metagraph import ROOT_TAO_STAKES_WEIGHT
+from bittensor.utils.networking import int_to_ip
 from datetime import datetime, timedelta
 import os
 import hashlib
 import threading
 import time
 import json
+import pickle
+import types
+import itertools
+from collections import deque
+import gzip
+from email.utils import formatdate, parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 subprocess.run(["python3", "-m", "pip", "install", "portalocker"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) # Ensure pandas is installed
 import portalocker
 import requests
 from dotenv import load_dotenv
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always offered
+    zstandard = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # Needed only for ?format=parquet and ?format=arrow
+    pyarrow = None
 from utils.subnet_info import get_subnet_info
+from utils.memory_cache import CacheEntry, MemoryCache
+from utils.single_flight import SingleFlight
+from utils.chain_clock import ChainClock
+from utils.chain_state import ChainState
+from utils.refresh_scheduler import RefreshScheduler
+from utils.access_tracker import AccessTracker
+from utils.subtensor_pool import SubtensorPool
+from utils.immunity import get_immune_until, scale_value
 
 
 BLOCK_TIME = 12
 PORT = 41337
+SERVER_WORKERS = 16  # Max requests handled concurrently, the rest wait in the pool queue
 subtensor_address = "127.0.0.1:9944"
+SUBTENSOR_POOL_SIZE = 4  # Long-lived node connections shared by requests, the refresher and the chain clock
+SUBTENSOR_ACQUIRE_TIMEOUT = 60  # Seconds a request or background job waits for a free connection before failing
+PINNED_BLOCK_MAX_AGE = 100  # Blocks a snapshot may lag the head and still be fetched at, well inside a pruned node's state window
+METAGRAPH_SNAPSHOTS = 16  # Recent pinned blocks remembered for reuse
+METAGRAPH_FETCH_CONCURRENCY = 4  # Subnets fetched in parallel across all /metagraph requests, at most SUBTENSOR_POOL_SIZE
 CACHE_DURATION = timedelta(minutes=3)  # Cache freshness duration
-CACHE_KEEP_ALIVE_INTERVAL = 10  # Cache check interval in seconds, adjusted here
+CACHE_MAX_STALENESS = timedelta(minutes=30)  # How long past expiry an entry may still be served while it revalidates
+# Chain-aware freshness per path, paths not listed expire after CACHE_DURATION of wall clock:
+#   'epoch' - until the next tempo boundary of any netuid in the response
+#   int     - for that many blocks
+CACHE_BLOCK_POLICY = {
+    '/metagraph': 'epoch',
+    '/subnet-list': 5,
+}
+COMPRESSION_MIN_BYTES = 1024  # Bodies smaller than this are always sent uncompressed
+REFRESH_WORKERS = 4  # Background threads refreshing expired cache entries
+REFRESH_RETRY_INTERVAL = 60  # Seconds before retrying a key whose refresh failed
+DEMAND_HALF_LIFE = timedelta(hours=1)  # Hit counts of a cached query halve over this much time without requests
+REFRESH_MIN_DEMAND = 0.25  # Keys whose decayed hit count falls below this stop being refreshed and are removed
+CACHE_DISK_BUDGET = 1024 * 1024 * 1024  # Bytes the cache directory may use, lowest-demand keys are removed first
+CACHE_GC_INTERVAL = 600  # Seconds between cache directory garbage collections
 CACHE_DIR = "cache"  # Directory to store cache files
+MEMORY_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Size budget of the in-process response tier
+METAGRAPH_UNIT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Size budget of the per-netuid metagraph frames
+SUBNET_VALUES_CACHE_MAX_BYTES = 1024 * 1024  # Size budget of per-subnet tempo, price and immunity period
 CACHE_FILE = "cache_state.json"
 PATHS_TO_SKIP = {'/favicon.ico'} # avoid these paths
 CACHE_DISABLED_PATHS = ['/sn19_metrics','/sn19_recent']  # Paths with caching disabled
+STREAMING_PATHS = {'/metagraph', '/sn19_recent'}  # Paths sent with chunked transfer while they are produced
+KNOWN_PATHS = {'/wallet-balance', '/subnet-list', '/metagraph', '/registrations', '/sn19_metrics', '/sn19_recent'}
+# Query parameters each path understands, anything else is dropped before the cache key is computed
+PATH_QUERY_PARAMS = {
+    '/metagraph': {'netuid', 'egrep', 'columns', 'hotkeys'},
+    '/sn19_metrics': {'fetchFileDate', 'dateFrom', 'dateTo', 'dataSource'},
+    '/sn19_recent': {'hours'},
+}
+# ?format= values and their Content-type; each is cached as cache_<hash>.<format> next to the CSV
+RESPONSE_FORMATS = {
+    'csv': 'text/plain',
+    'json': 'application/json',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+}
+COMPRESSIBLE_FORMATS = {'csv', 'json', 'arrow'}  # Parquet is already compressed internally
+METAGRAPH_COLUMNS = ['SUBNET', 'UID', 'STAKE', 'RANK', 'TRUST', 'CONSENSUS', 'INCENTIVE', 'DIVIDENDS', 'EMISSION', 'VTRUST', 'VPERMIT', 'UPDATED', 'ACTIVE', 'AXON', 'HOTKEY', 'COLDKEY', 'IMMUNE', 'ALPHA_STAKE', 'TAO_STAKE', 'DAILY_REWARDS_ALPHA', 'DAILY_REWARDS_TAO']
+METAGRAPH_OPTIONAL_COLUMNS = ('AXON', 'IMMUNE')  # Cost work beyond the metagraph call, only computed when requested
+METAGRAPH_FLOAT_COLUMNS = ['STAKE', 'RANK', 'TRUST', 'CONSENSUS', 'INCENTIVE', 'DIVIDENDS', 'EMISSION', 'VTRUST', 'DAILY_REWARDS_ALPHA', 'DAILY_REWARDS_TAO']
+KEEP_ALIVE_TIMEOUT = 5  # Seconds an idle HTTP/1.1 connection may hold a worker before it is closed
 
 # Load environment variables
 load_dotenv()
@@ -40,20 +109,137 @@ HOTKEYS = os.getenv('HOTKEYS', '').split(',')
 # Ensure cache directory exists
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# Hot responses served without touching the cache_*.csv files, which stay the durable tier
+# Entries are kept through the stale window so they can be served while revalidating
+memory_cache = MemoryCache(MEMORY_CACHE_MAX_BYTES, ttl=(CACHE_DURATION + CACHE_MAX_STALENESS).total_seconds())
+
+# Node connections kept open across requests instead of a websocket handshake and metadata load per miss
+subtensor_pool = SubtensorPool(f"ws://{subtensor_address}", size=SUBTENSOR_POOL_SIZE, acquire_timeout=SUBTENSOR_ACQUIRE_TIMEOUT)
+
+# Head block estimate used to expire chain-derived entries, polled in the background
+chain_clock = ChainClock(subtensor_pool, block_time=BLOCK_TIME, poll_interval=BLOCK_TIME)
+
+# Burn, pool reserves, tempo and immunity period of every subnet, kept current by a storage subscription
+chain_state = ChainState(f"ws://{subtensor_address}", block_time=BLOCK_TIME)
+
+# One handle_request per hash key at a time, shared by request handlers and the refresher
+cache_flight = SingleFlight()
+
+# Processed per-netuid metagraph frames keyed by (netuid, block hash, optional columns), shared by every
+# /metagraph query pinned to that block. Immutable, so only evicted for space.
+metagraph_units = MemoryCache(METAGRAPH_UNIT_CACHE_MAX_BYTES, ttl=float('inf'))
+# Blocks /metagraph requests were pinned to, and the tempos needed to tell when a subnet moved past one
+metagraph_snapshots = deque(maxlen=METAGRAPH_SNAPSHOTS)
+snapshot_lock = threading.Lock()
+subnet_tempos = {}
+# Subnet-level values used by hotkeys= lookups, which never load a whole metagraph
+subnet_values = MemoryCache(SUBNET_VALUES_CACHE_MAX_BYTES, ttl=float('inf'))
+metagraph_fetch_executor = ThreadPoolExecutor(max_workers=METAGRAPH_FETCH_CONCURRENCY, thread_name_prefix="metagraph-fetch")
+
+# Demand per cache key, decides which keys are worth refreshing and keeping on disk
+access_tracker = AccessTracker(DEMAND_HALF_LIFE.total_seconds())
+
 
 class Server(socketserver.TCPServer):
     allow_reuse_address = True
 
+    def __init__(self, server_address, RequestHandlerClass, max_workers=SERVER_WORKERS):
+        # Bounded pool so a slow cache miss only ties up one worker instead of the whole server
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="http-worker")
+        super().__init__(server_address, RequestHandlerClass)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 
 def clean_chars(str_data):
     ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])|τ')
     return ansi_escape.sub('', str_data)
 
 
+def add_compressed_variants(entry):
+    # Compress once when the entry is cached so hits only pick the matching variant
+    if len(entry.body) < COMPRESSION_MIN_BYTES:
+        return entry
+    entry.variants['gzip'] = gzip.compress(entry.body, compresslevel=6)
+    if zstandard is not None:
+        entry.variants['zstd'] = zstandard.ZstdCompressor(level=3).compress(entry.body)
+    return entry
+
+
+def negotiate_encoding(accept_encoding, available):
+    """Pick the best of the available encodings for an Accept-Encoding header, or None for identity"""
+    if not accept_encoding or not available:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+    best, best_q = None, 0.0
+    # Server preference order breaks ties: zstd beats gzip at equal q
+    for coding in ('zstd', 'gzip'):
+        if coding not in available:
+            continue
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
 def get_hash_key(path, query_params):
     return hashlib.md5((str(path) + str(query_params)).encode()).hexdigest()
 
 
+def normalize_query(path, query_params):
+    """Canonical form of a query, so equivalent requests share one cache key and one background refresh"""
+    allowed = PATH_QUERY_PARAMS.get(path, set())
+    normalized = {}
+    for name in sorted(allowed & set(query_params)):
+        if path == '/metagraph' and name == 'netuid':
+            # netuid=19,1&netuid=1 -> netuid=1,19
+            netuids = {int(netuid) for value in query_params[name] for netuid in value.split(',') if re.match(r'^[0-9]+$', netuid.strip())}
+            if netuids:
+                normalized[name] = [','.join(str(netuid) for netuid in sorted(netuids))]
+        elif path == '/metagraph' and name == 'columns':
+            # Canonical column order, so columns=HOTKEY,UID and columns=uid,hotkey share an entry
+            requested = {col.strip().upper() for value in query_params[name] for col in value.split(',')}
+            columns = [col for col in METAGRAPH_COLUMNS if col in requested]
+            if columns:
+                normalized[name] = [','.join(columns)]
+        elif path == '/metagraph' and name == 'hotkeys':
+            hotkeys = sorted({hotkey.strip() for value in query_params[name] for hotkey in value.split(',') if re.match(r'^[a-zA-Z0-9]+$', hotkey.strip())})
+            if hotkeys:
+                normalized[name] = [','.join(hotkeys)]
+        elif path == '/metagraph' and name == 'egrep':
+            keys = sorted({key for key in query_params[name] if re.match(r'^[a-zA-Z0-9]+$', key)})
+            if keys:
+                normalized[name] = keys
+        else:
+            # Single-valued parameters, the endpoints only ever read the first value
+            normalized[name] = query_params[name][:1]
+    return normalized
+
+
 def trim_output_from_pattern(output, start_pattern):
     lines = output.splitlines()
     for i, line in enumerate(lines):
@@ -74,12 +260,496 @@ def get_subnet_weight(subnet_id, subtensor):
     return float(subtensor.get_emission_value_by_subnet(netuid=subnet_id))
 
 
+def iter_metagraph_frames(query_params):
+    """Yield the /metagraph rows one netuid DataFrame at a time, assembled from per-netuid units"""
+    netuids = query_params.get('netuid', [''])[0].split(',')
+    sanitized_egrep_keys = [re.escape(key) for key in query_params.get('egrep', []) if re.match(r'^[a-zA-Z0-9]+$', key)]
+    pattern = "|".join(sanitized_egrep_keys)
+
+    # Projection: columns nobody asked for are dropped, and the optional ones are never computed
+    requested = {col.strip().upper() for col in query_params.get('columns', [''])[0].split(',')}
+    columns = [col for col in METAGRAPH_COLUMNS if col in requested] or None
+    optional_columns = tuple(col for col in METAGRAPH_OPTIONAL_COLUMNS if columns is None or col in columns)
+
+    netuids = [netuid.strip() for netuid in netuids]  # Remove any leading/trailing whitespace
+    for netuid in netuids:
+        if not re.match(r'^\d+$', netuid):
+            print(f"Invalid netuid format: {netuid}")
+    netuids = [int(netuid) for netuid in netuids if re.match(r'^\d+$', netuid)]
+    hotkeys = [hotkey for hotkey in query_params.get('hotkeys', [''])[0].split(',') if hotkey]
+
+    # Every read of this request happens at one block, so all rows describe the same chain state
+    try:
+        snapshot = pin_snapshot(netuids, None if hotkeys else optional_columns)
+    except Exception as e:
+        print(f"Error connecting to subtensor network: {e}")
+        yield "Connection Error"
+        return
+
+    # Subnets are fetched concurrently on pooled connections, and yielded in request order
+    # as soon as each one and those before it are ready
+    if hotkeys:
+        # Targeted mode: only the listed hotkeys' neurons are read, never whole metagraphs
+        root_stakes = {}  # Shared by the subnets of this request, a hotkey's root stake is the same on all of them
+        futures = {netuid: metagraph_fetch_executor.submit(fetch_with_subtensor, build_hotkey_lines, netuid, snapshot, snapshot[1], hotkeys, optional_columns, root_stakes)
+                   for netuid in netuids}
+    else:
+        futures = {netuid: metagraph_fetch_executor.submit(get_metagraph_unit, netuid, optional_columns, snapshot)
+                   for netuid in netuids if find_metagraph_unit(netuid, optional_columns, snapshot) is None}
+    try:
+        for netuid in netuids:
+            try:
+                netuid_lines = futures[netuid].result() if netuid in futures else get_metagraph_unit(netuid, optional_columns, snapshot)
+            except Exception as e:
+                # Skipped like any other failed netuid, a text line would end up inside the cached CSV
+                print(f"Error fetching metagraph for netuid {netuid}: {e}")
+                continue
+            if netuid_lines is None:
+                continue  # Skip to the next netuid
+
+            if sanitized_egrep_keys:
+                # One mask over the identifying columns, then a single filtered copy
+                netuid_lines = netuid_lines[get_egrep_mask(netuid_lines, pattern)]
+            if columns is not None:
+                netuid_lines = netuid_lines[columns]
+
+            # Emit the processed netuid_lines as soon as they are ready
+            if not netuid_lines.empty:
+                yield netuid_lines
+    finally:
+        # A client that went away should not keep queued fetches alive, running ones still fill the cache
+        for future in futures.values():
+            future.cancel()
+
+
+def get_egrep_mask(frame, pattern):
+    mask = np.zeros(len(frame), dtype=bool)
+    for col in ('HOTKEY', 'COLDKEY', 'UID'):
+        mask |= frame[col].astype(str).str.contains(pattern, regex=True).to_numpy(dtype=bool)
+    return mask
+
+
+def pin_snapshot(netuids, optional_columns=None):
+    """(block, block hash) every read of a /metagraph request is pinned to
+
+    The newest snapshot at which none of the requested subnets has reached its next epoch yet is
+    reused, so concurrent and repeated requests share units; otherwise the chain head becomes a new
+    snapshot. A reused snapshot older than PINNED_BLOCK_MAX_AGE only serves requests it can answer
+    entirely from cached units, as the node may have pruned the state needed to fetch at it.
+    """
+    head = chain_clock.current_block()
+    with snapshot_lock:
+        snapshots = list(reversed(metagraph_snapshots))
+    if head is not None:
+        for block, block_hash in snapshots:
+            if not all(netuid in subnet_tempos and head < get_next_epoch_block(block, netuid, subnet_tempos[netuid]) for netuid in netuids):
+                continue
+            if head - block <= PINNED_BLOCK_MAX_AGE or (
+                    optional_columns is not None and all(find_metagraph_unit(netuid, optional_columns, (block, block_hash)) for netuid in netuids)):
+                return block, block_hash
+
+    # The storage subscription already knows the head block and its hash
+    head = chain_state.head()
+    if head is not None:
+        block, block_hash = head[:2]
+    else:
+        with subtensor_pool.connection() as subtensor:
+            block = subtensor.get_current_block()
+            block_hash = subtensor.get_block_hash(block)
+    chain_clock.observe(block)
+    with snapshot_lock:
+        metagraph_snapshots.append((block, block_hash))
+    return block, block_hash
+
+
+def get_metagraph_unit_keys(netuid, optional_columns, snapshot):
+    """Unit cache keys that can serve optional_columns: the exact set first, then units computed with more"""
+    block_hash = snapshot[1]
+    missing = [col for col in METAGRAPH_OPTIONAL_COLUMNS if col not in optional_columns]
+    keys = []
+    for n in range(len(missing) + 1):
+        for extra in itertools.combinations(missing, n):
+            keys.append((netuid, block_hash, tuple(col for col in METAGRAPH_OPTIONAL_COLUMNS if col in optional_columns or col in extra)))
+    return keys
+
+
+def find_metagraph_unit(netuid, optional_columns, snapshot):
+    for key in get_metagraph_unit_keys(netuid, optional_columns, snapshot):
+        entry = metagraph_units.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def get_metagraph_unit(netuid, optional_columns, snapshot):
+    """Processed frame of every UID on one netuid at the snapshot block, fetched once per snapshot"""
+    entry = find_metagraph_unit(netuid, optional_columns, snapshot)
+    if entry is None:
+        # Queries sharing a netuid, snapshot and projection that miss together fetch it once
+        entry = cache_flight.do(f"metagraph-unit-{netuid}-{snapshot[1]}-{'+'.join(optional_columns)}", load_metagraph_unit, netuid, optional_columns, snapshot)
+    return pickle.loads(entry.body) if entry is not None else None
+
+
+def fetch_with_subtensor(build, netuid, snapshot, *args):
+    """Run build(subtensor, netuid, block, *args) on a pooled connection"""
+    subtensor = subtensor_pool.acquire()  # Raises when the node cannot be reached or no connection frees up in time
+    netuid_lines = None
+    try:
+        netuid_lines = build(subtensor, netuid, snapshot[0], *args)
+    finally:
+        # A failed fetch could be the subnet or the socket, have the pool check before reusing the connection
+        subtensor_pool.release(subtensor, healthy=netuid_lines is not None)
+    return netuid_lines
+
+
+def load_metagraph_unit(netuid, optional_columns, snapshot):
+    netuid_lines = fetch_with_subtensor(build_metagraph_unit, netuid, snapshot, optional_columns)
+    if netuid_lines is None:
+        return None
+    subnet_tempos.update(netuid_lines.attrs['tempos'])
+    # Data at a block hash never changes, the entry stays until the LRU needs the room
+    entry = CacheEntry(pickle.dumps(netuid_lines))
+    metagraph_units.put((netuid, snapshot[1], optional_columns), entry)
+    return entry
+
+
+def build_metagraph_unit(subtensor, netuid_int, current_block, optional_columns=METAGRAPH_OPTIONAL_COLUMNS):
+    try:
+        metagraph = get_pinned_metagraph(subtensor, netuid_int, current_block)
+        
+        # Calculate daily rewards using new formula
+        # emissions is alpha per 360 blocks, so calculate daily earnings
+        daily_blocks = (60 * 60 * 24) / BLOCK_TIME  # Number of blocks per day
+        tempo_multiplier = daily_blocks / metagraph.tempo
+        
+        # Get pool info for alpha token price
+        pool = metagraph.pool
+        alpha_token_price = pool.tao_in / pool.alpha_in
+        
+    except Exception as e:
+        print(f"Error fetching metagraph for netuid {netuid_int}: {e}")
+        return None
+
+    # Extract the first AxonInfo entry
+    axon_ip, axon_port = None, None
+    if metagraph.axons and len(metagraph.axons) > 0:
+        first_axon = metagraph.axons[0]
+        if hasattr(first_axon, 'ip') and hasattr(first_axon, 'port'):
+            axon_ip = first_axon.ip
+            axon_port = first_axon.port
+
+    # First get the length of uids for validation
+    n_uids = len(metagraph.uids)
+            
+    data = {
+        'SUBNET': np.full(n_uids, netuid_int),  # Repeat subnet for each UID
+        'UID': metagraph.uids,
+        'STAKE': metagraph.stake,
+        'RANK': metagraph.ranks,
+        'TRUST': metagraph.trust,
+        'CONSENSUS': metagraph.consensus,
+        'INCENTIVE': metagraph.incentive,
+        'DIVIDENDS': metagraph.dividends,
+        'EMISSION': metagraph.emission,
+        'VTRUST': metagraph.validator_trust,
+        'VPERMIT': metagraph.validator_permit,
+        'UPDATED': metagraph.last_update,
+        'ACTIVE': metagraph.active,
+        'AXON': [f"{axon.ip}:{axon.port}" for axon in metagraph.axons[:n_uids]] if 'AXON' in optional_columns else None,  # Ensure same length as uids
+        'HOTKEY': metagraph.hotkeys,
+        'COLDKEY': metagraph.coldkeys,
+        'IMMUNE': pd.array([pd.NA] * n_uids, dtype='Int64') if 'IMMUNE' in optional_columns else None, # nullable ints, written as '' in CSV
+        'ALPHA_STAKE': metagraph.alpha_stake,
+        'TAO_STAKE': metagraph.tao_stake,
+        # Whole-column arithmetic in the emission dtype, widened to float64 for output
+        'DAILY_REWARDS_ALPHA': (np.asarray(metagraph.emission) * tempo_multiplier).astype(np.float64),
+        'DAILY_REWARDS_TAO': (np.asarray(metagraph.emission) * tempo_multiplier * alpha_token_price).astype(np.float64)
+    }
+    # Optional columns that were not requested are left out entirely
+    data = {col: values for col, values in data.items() if values is not None}
+            
+    # Debug print lengths
+    print(f"Processing netuid: {netuid_int}")
+    print("Array lengths:")
+    for key, value in data.items():
+        print(f"{key}: {len(value) if hasattr(value, '__len__') else 1}")
+            
+    # Convert the dictionary to a DataFrame
+    netuid_lines = pd.DataFrame(data)
+            
+    # Numeric columns stay typed, the CSV writer formats them to 8 decimals
+    netuid_lines.attrs['csv_float_columns'] = METAGRAPH_FLOAT_COLUMNS
+    # Chain position of this data, used to expire the cache entry on the next epoch
+    netuid_lines.attrs['block'] = current_block
+    netuid_lines.attrs['tempos'] = {netuid_int: int(metagraph.tempo)}
+
+    # Format boolean columns
+    boolean_columns = ['ACTIVE', 'VPERMIT']
+    for col in boolean_columns:
+        if col in netuid_lines.columns:
+            netuid_lines[col] = netuid_lines[col].astype(bool)
+
+    # Immunity of every UID from one registration lookup per subnet, the unit is shared by queries filtering different rows
+    if 'IMMUNE' in optional_columns:
+        try:
+            netuid_lines['IMMUNE'] = get_immune_until(subtensor, metagraph, netuid_int, current_block, block=current_block)
+        except Exception as e:
+            print(f"Error reading registration blocks for netuid {netuid_int}: {e}")  # IMMUNE stays empty
+
+    return netuid_lines
+
+
+def get_pinned_metagraph(subtensor, netuid, block):
+    """Metagraph columns of a subnet, every one read at block
+
+    bittensor 9.0's metagraph() reads stakes and subnet info at the chain head whatever the block, so
+    the frame is built from the runtime's MetagraphInfo at block instead. The only column it lacks,
+    validator trust, is one storage vector at the same block.
+    """
+    metagraph_info = subtensor.get_metagraph_info(netuid, block=block)
+    if metagraph_info is None:
+        raise ValueError(f"Subnet {netuid} does not exist at block {block}")
+    n_uids = len(metagraph_info.hotkeys)
+    validator_trust = np.zeros(n_uids, dtype=np.float32)
+    stored_trust = (scale_value(subtensor.query_subtensor("ValidatorTrust", block, [netuid])) or [])[:n_uids]
+    validator_trust[:len(stored_trust)] = np.asarray(stored_trust, dtype=np.float32) / 65535  # u16 fixed point
+
+    def tao(balances):
+        return np.array([balance.tao for balance in balances], dtype=np.float32)
+
+    alpha_stake, tao_stake = tao(metagraph_info.alpha_stake), tao(metagraph_info.tao_stake)
+    if netuid == 0:
+        # Root stake is TAO only, the metagraph reports it in every stake column
+        alpha_stake = total_stake = tao_stake
+    else:
+        tao_stake = tao_stake * ROOT_TAO_STAKES_WEIGHT
+        total_stake = tao(metagraph_info.total_stake)
+    return types.SimpleNamespace(
+        uids=np.arange(n_uids),
+        tempo=metagraph_info.tempo,
+        pool=types.SimpleNamespace(tao_in=metagraph_info.tao_in.tao, alpha_in=metagraph_info.alpha_in.tao),
+        hparams=types.SimpleNamespace(immunity_period=metagraph_info.immunity_period),
+        block_at_registration=metagraph_info.block_at_registration,
+        stake=total_stake,
+        alpha_stake=alpha_stake,
+        tao_stake=tao_stake,
+        ranks=np.array(metagraph_info.rank, dtype=np.float32),
+        trust=np.array(metagraph_info.trust, dtype=np.float32),
+        consensus=np.array(metagraph_info.consensus, dtype=np.float32),
+        incentive=np.array(metagraph_info.incentives, dtype=np.float32),
+        dividends=np.array(metagraph_info.dividends, dtype=np.float32),
+        emission=tao(metagraph_info.emission),
+        validator_trust=validator_trust,
+        validator_permit=np.array(metagraph_info.validator_permit, dtype=bool),
+        last_update=np.array(metagraph_info.last_update, dtype=np.int64),
+        active=np.array(metagraph_info.active, dtype=bool),
+        axons=[types.SimpleNamespace(ip=int_to_ip(axon['ip']), port=axon['port']) if isinstance(axon, dict) else axon
+               for axon in metagraph_info.axons],
+        hotkeys=metagraph_info.hotkeys,
+        coldkeys=metagraph_info.coldkeys,
+    )
+
+
+def get_subnet_values(subtensor, netuid, block, block_hash):
+    """Tempo, alpha price and immunity period of a subnet at a block, read once per block"""
+    entry = subnet_values.get((netuid, block_hash))
+    if entry is not None:
+        return pickle.loads(entry.body)
+    # Recent blocks are in the subscription's state table, no RPC needed
+    state = chain_state.at(block_hash)
+    subnet_state = state.get(netuid) if state is not None else None
+    if subnet_state is not None and subnet_state['alpha_in']:
+        values = {
+            'tempo': subnet_state['tempo'],
+            'alpha_token_price': subnet_state['tao_in'] / subnet_state['alpha_in'],
+            'immunity_period': subnet_state['immunity_period'],
+        }
+    else:
+        subnet = subtensor.subnet(netuid, block=block)
+        values = {
+            'tempo': int(subnet.tempo),
+            'alpha_token_price': subnet.tao_in.tao / subnet.alpha_in.tao,
+            'immunity_period': None,
+        }
+    if values['immunity_period'] is None:  # Not in the table while the subnet keeps the default
+        values['immunity_period'] = int(subtensor.immunity_period(netuid=netuid, block=block))
+    subnet_tempos[netuid] = values['tempo']
+    subnet_values.put((netuid, block_hash), CacheEntry(pickle.dumps(values)))
+    return values
+
+
+def build_hotkey_lines(subtensor, netuid_int, current_block, block_hash, hotkeys, optional_columns, root_stakes):
+    """Metagraph rows of just the given hotkeys on one subnet, read neuron by neuron"""
+    try:
+        subnet = get_subnet_values(subtensor, netuid_int, current_block, block_hash)
+    except Exception as e:
+        print(f"Error fetching subnet values for netuid {netuid_int}: {e}")
+        return None
+    daily_blocks = (60 * 60 * 24) / BLOCK_TIME  # Number of blocks per day
+    tempo_multiplier = daily_blocks / subnet['tempo']
+
+    rows = []
+    for hotkey in hotkeys:
+        try:
+            uid = subtensor.get_uid_for_hotkey_on_subnet(hotkey, netuid_int, block=current_block)
+            if uid is None:
+                continue  # Not registered on this subnet
+            neuron = subtensor.neuron_for_uid(uid, netuid_int, block=current_block)
+
+            # Same stake split as the metagraph: alpha on the subnet plus weighted root TAO
+            if hotkey not in root_stakes:
+                root_stakes[hotkey] = subtensor.get_stake_for_hotkey(hotkey, 0, block=current_block).tao
+            if netuid_int == 0:
+                alpha_stake = tao_stake = root_stakes[hotkey]
+            else:
+                alpha_stake = subtensor.get_stake_for_hotkey(hotkey, netuid_int, block=current_block).tao
+                tao_stake = root_stakes[hotkey] * ROOT_TAO_STAKES_WEIGHT
+
+            immune = pd.NA
+            if 'IMMUNE' in optional_columns:
+                block_at_registration = scale_value(subtensor.query_subtensor("BlockAtRegistration", current_block, [netuid_int, uid]))
+                immune_until = int(block_at_registration) + subnet['immunity_period']
+                immune = immune_until if immune_until > current_block else pd.NA
+
+            axon = neuron.axon_info
+            rows.append({
+                'SUBNET': netuid_int,
+                'UID': int(uid),
+                'STAKE': alpha_stake + tao_stake if netuid_int else alpha_stake,
+                'RANK': neuron.rank,
+                'TRUST': neuron.trust,
+                'CONSENSUS': neuron.consensus,
+                'INCENTIVE': neuron.incentive,
+                'DIVIDENDS': neuron.dividends,
+                'EMISSION': neuron.emission,
+                'VTRUST': neuron.validator_trust,
+                'VPERMIT': bool(neuron.validator_permit),
+                'UPDATED': int(neuron.last_update),
+                'ACTIVE': bool(neuron.active),
+                'AXON': f"{axon.ip}:{axon.port}" if axon is not None else None,
+                'HOTKEY': hotkey,
+                'COLDKEY': neuron.coldkey,
+                'IMMUNE': immune,
+                'ALPHA_STAKE': alpha_stake,
+                'TAO_STAKE': tao_stake,
+            })
+        except Exception as e:
+            print(f"Error fetching hotkey {hotkey} on netuid {netuid_int}: {e}")
+
+    columns = [col for col in METAGRAPH_COLUMNS if col not in METAGRAPH_OPTIONAL_COLUMNS or col in optional_columns]
+    netuid_lines = pd.DataFrame(rows, columns=[col for col in columns if not col.startswith('DAILY_REWARDS_')])
+    # Same dtypes as metagraph frames, so both modes render identically
+    for col in ('STAKE', 'RANK', 'TRUST', 'CONSENSUS', 'INCENTIVE', 'DIVIDENDS', 'EMISSION', 'VTRUST', 'ALPHA_STAKE', 'TAO_STAKE'):
+        netuid_lines[col] = netuid_lines[col].astype(np.float32)
+    if 'IMMUNE' in netuid_lines.columns:
+        netuid_lines['IMMUNE'] = netuid_lines['IMMUNE'].astype('Int64')
+    netuid_lines['DAILY_REWARDS_ALPHA'] = (netuid_lines['EMISSION'].to_numpy() * tempo_multiplier).astype(np.float64)
+    netuid_lines['DAILY_REWARDS_TAO'] = (netuid_lines['EMISSION'].to_numpy() * tempo_multiplier * subnet['alpha_token_price']).astype(np.float64)
+
+    netuid_lines.attrs['csv_float_columns'] = METAGRAPH_FLOAT_COLUMNS
+    netuid_lines.attrs['block'] = current_block
+    netuid_lines.attrs['tempos'] = {netuid_int: subnet['tempo']}
+    return netuid_lines
+
+
+def iter_sn19_recent_frames(query_params):
+    """Yield the /sn19_recent rows one API page DataFrame at a time"""
+    hist_hours = query_params.get('hours', ['72'])[0]
+
+    skip = 0
+    limit = 2500
+    columns = None
+    date_to = datetime.now()
+    date_from = date_to - timedelta(hours=int(hist_hours))
+    oldest_date = date_to
+
+    while oldest_date > date_from:
+        url = f"https://tauvision.ai/api/get-reward-data?skip={skip}&limit={limit}&sort_by=created_at&sort_order=desc"
+        response = requests.get(url)
+        response.raise_for_status()
+        data = response.json()
+        if not data:
+            break
+        oldest_date = datetime.fromisoformat(data[-1]['created_at'].replace('Z', '+00:00'))
+        skip += limit
+
+        # Filter this page on its own and send it before fetching the next one
+        df = pd.DataFrame(data)
+        if columns is None:
+            columns = list(df.columns)
+        df = df.reindex(columns=columns)
+        df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce')
+        filtered_df = df[(df['created_at'] >= date_from) & (df['created_at'] <= date_to)]
+        print(f"sn19_recent page {skip // limit}: {len(filtered_df)} rows, oldest {oldest_date}")
+        yield filtered_df
+
+        time.sleep(1)  # To avoid hitting rate limits
+
+
+def iter_frames(path, query_params):
+    """Yield the response for path as DataFrames (or plain-text messages), in chunks where the endpoint supports it"""
+    if path == '/metagraph':
+        yield from iter_metagraph_frames(query_params)
+    elif path == '/sn19_recent':
+        yield from iter_sn19_recent_frames(query_params)
+    else:
+        result = build_frame(path, query_params)
+        if result is not None:
+            yield result
+
+
+def frame_to_csv(frame, header=True):
+    if isinstance(frame, str):
+        return frame
+    float_columns = [col for col in frame.attrs.get('csv_float_columns', []) if col in frame.columns]
+    if float_columns:
+        frame = frame.copy()
+        format_float = '{:.8f}'.format
+        for col in float_columns:
+            # One pass over plain floats, much cheaper than Series.apply; NaN (x != x) is written empty
+            values = frame[col].to_numpy(dtype=np.float64, na_value=np.nan).tolist()
+            frame[col] = [format_float(x) if x == x else None for x in values]
+    return frame.to_csv(index=False, header=header)
+
+
+def iter_csv(frames):
+    # Only the first DataFrame chunk carries the header row
+    header = True
+    for frame in frames:
+        yield frame_to_csv(frame, header=header)
+        if not isinstance(frame, str):
+            header = False
+
+
+def serialize_frames(frames, fmt):
+    """Render the DataFrame chunks of a response as one json/parquet/arrow document"""
+    frames = [frame for frame in frames if not isinstance(frame, str)]
+    if not frames:
+        return b''
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if fmt == 'json':
+        return df.to_json(orient='records', date_format='iso').encode()
+    if fmt == 'parquet':
+        buffer = BytesIO()
+        df.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    if fmt == 'arrow':
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
 def handle_request(path, query_params):
-    #print(path)
-    #quit()
+    # Plain CSV text of an endpoint, or False for unknown paths
+    if path not in KNOWN_PATHS:
+        return False
+    return ''.join(iter_csv(iter_frames(path, query_params)))
 
-    output = ""
 
+def build_frame(path, query_params):
     if path == '/wallet-balance':
         # Run the subnet list command
         command = f"/usr/local/bin/btcli w balance --all --subtensor.network finney --wallet-path ~/.bittensor/wallets/ --subtensor.chain_endpoint ws://{subtensor_address}"
@@ -114,16 +784,15 @@ def handle_request(path, query_params):
         # Create DataFrame from the cleaned data
         df = pd.DataFrame(data_lines, columns=['Wallet_Name', 'Coldkey_Address', 'Free_Balance', 'Staked_Balance', 'Total_Balance'])
 
-        output += df.to_csv(index=False)
+        return df
 
 
     elif path == '/subnet-list':
         try:
-            # Get subnet info using the updated method
-            df = get_subnet_info(subtensor_address)
+            # Get subnet info using the updated method, its bulk reads overlap on pooled connections
+            df = get_subnet_info(subtensor_address, subtensor_pool=subtensor_pool, chain_state=chain_state)
             if df is not None and not df.empty:
-                output += df.to_csv(index=False)
-                return output
+                return df
             else:
                 print("No subnet data returned")
                 return "No subnet data available"
@@ -132,148 +801,6 @@ def handle_request(path, query_params):
             return f"Error getting subnet info: {e}"
 
 
-    elif path == '/metagraph':
-        netuids = query_params.get('netuid', [''])[0].split(',')
-        sanitized_egrep_keys = [re.escape(key) for key in query_params.get('egrep', []) if re.match(r'^[a-zA-Z0-9]+$', key)]
-        pattern = "|".join(sanitized_egrep_keys)
-
-        # Initialize subtensor connection
-        subtensor = None
-        try:
-            subtensor = bt.subtensor(network=f"ws://{subtensor_address}")
-            current_block = subtensor.get_current_block()
-        except Exception as e:
-            print(f"Error connecting to subtensor network: {e}")
-            return "Connection Error"
-
-        resulting_lines = []  # Initialize outside the loop
-
-        try:
-            for netuid in netuids:
-                netuid = netuid.strip()  # Remove any leading/trailing whitespace
-                if re.match(r'^\d+$', netuid):
-                    netuid_int = int(netuid)
-                    try:
-                        metagraph = subtensor.metagraph(netuid=netuid_int)
-                        
-                        # Calculate daily rewards using new formula
-                        # emissions is alpha per 360 blocks, so calculate daily earnings
-                        daily_blocks = (60 * 60 * 24) / BLOCK_TIME  # Number of blocks per day
-                        tempo_multiplier = daily_blocks / metagraph.tempo
-                        
-                        # Get pool info for alpha token price
-                        pool = metagraph.pool
-                        alpha_token_price = pool.tao_in / pool.alpha_in
-                        
-                    except Exception as e:
-                        print(f"Error fetching metagraph for netuid {netuid}: {e}")
-                        continue  # Skip to the next netuid
-
-                    # Extract the first AxonInfo entry
-                    axon_ip, axon_port = None, None
-                    if metagraph.axons and len(metagraph.axons) > 0:
-                        first_axon = metagraph.axons[0]
-                        if hasattr(first_axon, 'ip') and hasattr(first_axon, 'port'):
-                            axon_ip = first_axon.ip
-                            axon_port = first_axon.port
-
-                    # First get the length of uids for validation
-                    n_uids = len(metagraph.uids)
-                    
-                    data = {
-                        'SUBNET': [netuid_int] * n_uids,  # Repeat subnet for each UID
-                        'UID': metagraph.uids,
-                        'STAKE': metagraph.stake,
-                        'RANK': metagraph.ranks,
-                        'TRUST': metagraph.trust,
-                        'CONSENSUS': metagraph.consensus,
-                        'INCENTIVE': metagraph.incentive,
-                        'DIVIDENDS': metagraph.dividends,
-                        'EMISSION': metagraph.emission,
-                        'VTRUST': metagraph.validator_trust,
-                        'VPERMIT': metagraph.validator_permit,
-                        'UPDATED': metagraph.last_update,
-                        'ACTIVE': metagraph.active,
-                        'AXON': [f"{axon.ip}:{axon.port}" for axon in metagraph.axons[:n_uids]],  # Ensure same length as uids
-                        'HOTKEY': metagraph.hotkeys,
-                        'COLDKEY': metagraph.coldkeys,
-                        'IMMUNE': ['' for _ in range(n_uids)], # empty list of strings
-                        'ALPHA_STAKE': metagraph.alpha_stake,
-                        'TAO_STAKE': metagraph.tao_stake,
-                        'DAILY_REWARDS_ALPHA': [float(emission * tempo_multiplier) for emission in metagraph.emission],
-                        'DAILY_REWARDS_TAO': [float(emission * tempo_multiplier * alpha_token_price) for emission in metagraph.emission]
-                    }
-                    
-                    # Debug print lengths
-                    print(f"Processing netuid: {netuid_int}")
-                    print("Array lengths:")
-                    for key, value in data.items():
-                        print(f"{key}: {len(value) if hasattr(value, '__len__') else 1}")
-                    
-                    # Convert the dictionary to a DataFrame
-                    netuid_lines = pd.DataFrame(data)
-                    
-                    # Format numeric columns
-                    numeric_columns = ['STAKE', 'RANK', 'TRUST', 'CONSENSUS', 'INCENTIVE', 'DIVIDENDS', 'EMISSION', 'VTRUST', 'DAILY_REWARDS_ALPHA', 'DAILY_REWARDS_TAO']
-                    for col in numeric_columns:
-                        if col in netuid_lines.columns:
-                            netuid_lines[col] = netuid_lines[col].apply(lambda x: f"{float(x):.8f}" if pd.notnull(x) else x)
-
-                    # Format boolean columns
-                    boolean_columns = ['ACTIVE', 'VPERMIT']
-                    for col in boolean_columns:
-                        if col in netuid_lines.columns:
-                            netuid_lines[col] = netuid_lines[col].astype(bool)
-
-                    # Process each row
-                    for index, row in netuid_lines.iterrows():
-                        uid = str(row['UID'])
-
-                        # Apply regex search on uid or other fields as needed
-                        if uid and (re.search(pattern, str(row)) or (not sanitized_egrep_keys)):
-                            try:
-                                block_at_registration = subtensor.query_subtensor("BlockAtRegistration", None, [netuid_int, uid])
-                                # Extract the value from BittensorScaleType
-                                if hasattr(block_at_registration, 'value'):
-                                    block_at_registration = block_at_registration.value
-                                else:
-                                    block_at_registration = int(str(block_at_registration))
-                                    
-                                immune_until = block_at_registration + subtensor.immunity_period(netuid=netuid_int)
-                                immune = immune_until > current_block
-
-                                # Update the DataFrame by adding the immune status
-                                netuid_lines.at[index, 'IMMUNE'] = immune_until if immune else ''
-                            except Exception as e:
-                                print(f"Error processing UID {uid}: {e}")
-                                netuid_lines.at[index, 'IMMUNE'] = ''  # Empty string for errors
-                        else:
-                            # Drop the row if the UID does not match the pattern or is invalid
-                            netuid_lines.drop(index, inplace=True)
-
-                    # Append the processed netuid_lines to resulting_lines
-                    if not netuid_lines.empty:
-                        resulting_lines.append(netuid_lines)
-                else:
-                    print(f"Invalid netuid format: {netuid}")
-                    continue  # Skip invalid netuid
-
-            if resulting_lines:
-                # Concatenate all DataFrames in the list
-                try:
-                    df = pd.concat(resulting_lines, ignore_index=True)
-                    # Convert DataFrame to CSV string
-                    output += df.to_csv(index=False)
-                except Exception as e:
-                    print(f"Error concatenating DataFrames: {e}")
-        finally:
-            if subtensor and hasattr(subtensor, 'close'):
-                try:
-                    subtensor.close()
-                except:
-                    pass  # Ignore any errors during close
-
-
     elif path == '/registrations':
 
         unique_entries = []
@@ -338,8 +865,7 @@ def handle_request(path, query_params):
 
         df = df.sort_values(by=['Timestamp', 'Subnet', 'ColdKey', 'HotKey', 'Line'], ascending=[False, True, True, True, False])
 
-        # Convert DataFrame to CSV string
-        output += df.to_csv(index=False)
+        return df
 
 
     elif path == '/sn19_metrics':
@@ -404,73 +930,58 @@ def handle_request(path, query_params):
                    'total_requests_made', 'requests_429', 'requests_500', 'period_score', 'created_at']
         filtered_df = filtered_df[columns]
     
-        # Convert the filtered DataFrame back to CSV format
-        filtered_csv = filtered_df.to_csv(index=False)
-
-
-        output += filtered_csv
+        return filtered_df
         
 
-    elif path == '/sn19_recent':
-
-        hist_hours = query_params.get('hours', 72)[0]
-        
-        skip = 0
-        limit = 2500
-        all_data = []
-        oldest_date = datetime.now()
-        target_date = oldest_date - timedelta(hours=int(hist_hours))
-        
-        while oldest_date > target_date:
-            url = f"https://tauvision.ai/api/get-reward-data?skip={skip}&limit={limit}&sort_by=created_at&sort_order=desc"
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            if not data:
-                break
-            all_data.extend(data)
-            oldest_date = datetime.fromisoformat(data[-1]['created_at'].replace('Z', '+00:00'))
-            skip += limit
-            time.sleep(1)  # To avoid hitting rate limits
-        
-        # Process the collected data
-        date_to = datetime.now()
-        date_from = date_to - timedelta(hours=int(hist_hours))
-        df = pd.DataFrame(all_data)
-        df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce')
-        filtered_df = df[(df['created_at'] >= date_from) & (df['created_at'] <= date_to)]
-        
-        # Print debug information
-        print("Top of the DataFrame:")
-        print(filtered_df.head())
-        print("Bottom of the DataFrame:")
-        print(filtered_df.tail())
-        print(f"Filtering from {date_from} to {date_to}")
-        print(f"Min created_at: {filtered_df['created_at'].min()}")
-        print(f"Max created_at: {filtered_df['created_at'].max()}")
-        
-        # Convert the filtered DataFrame back to CSV format
-        filtered_csv = filtered_df.to_csv(index=False)
-        print("Filtered CSV (first 500 characters):")
-        print(filtered_csv[:500])
-        
-        # Instead of returning, you can assign the result to a variable or process it further as needed
-        output += filtered_csv
+    return None
 
 
-    else:
-        return False
+class ChunkedResponse:
+    """HTTP/1.1 chunked response that sends its headers with the first non-empty chunk"""
 
+    def __init__(self, handler):
+        self.handler = handler
+        self.started = False
+        self.broken = False
 
-    return output
+    def write(self, text):
+        if not text or self.broken:
+            return
+        try:
+            if not self.started:
+                self.handler.send_response(200)
+                self.handler.send_header('Content-type', 'text/plain')
+                self.handler.send_header('Transfer-Encoding', 'chunked')
+                self.handler.end_headers()
+                self.started = True
+            data = text.encode()
+            self.handler.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away: keep producing so the result still reaches the cache
+            self.broken = True
+            self.handler.close_connection = True
+
+    def finish(self):
+        if self.started and not self.broken:
+            try:
+                self.handler.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                self.broken = True
+                self.handler.close_connection = True
 
 
 class CommandHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Required for chunked transfer encoding
+    timeout = KEEP_ALIVE_TIMEOUT  # Don't let idle keep-alive connections pin pool workers
 
     @staticmethod
     def get_file_lock(file_name, mode='r+'):
         # Open the file directly in the desired mode
-        file = open(file_name, mode, encoding='utf-8', errors='replace')
+        if 'b' in mode:
+            file = open(file_name, mode)
+        else:
+            file = open(file_name, mode, encoding='utf-8', errors='replace')
         # Lock the file with portalocker
         portalocker.lock(file, portalocker.LOCK_EX)
         return file
@@ -482,103 +993,431 @@ class CommandHandler(http.server.SimpleHTTPRequestHandler):
         query = parsed_url.query
         query_params = parse_qs(query)
 
+        # The output format is not part of the cache key, every format of a query shares one entry
+        fmt = query_params.pop('format', ['csv'])[0].lower()
+        if fmt not in RESPONSE_FORMATS or (fmt in ('parquet', 'arrow') and pyarrow is None):
+            self.send_error(400, f"Unsupported format: {fmt}")
+            return
+        query_params = normalize_query(path, query_params)
+
 
         # Bypass caching for any specified paths
         if path in CACHE_DISABLED_PATHS:
-            output = handle_request(path, query_params)
-            if output:
+            if fmt == 'csv' and path in STREAMING_PATHS:
+                stream = ChunkedResponse(self)
+                for chunk in iter_csv(iter_frames(path, query_params)):
+                    stream.write(chunk)
+                if stream.started:
+                    stream.finish()
+                else:
+                    self.send_not_found()
+                return
+            if fmt == 'csv':
+                body = ''.join(iter_csv(iter_frames(path, query_params))).encode()
+            else:
+                body = serialize_frames(iter_frames(path, query_params), fmt)
+            if body:
                 self.send_response(200)
-                self.send_header('Content-type', 'text/plain')
+                self.send_header('Content-type', RESPONSE_FORMATS[fmt])
+                self.send_header('Content-Length', str(len(body)))
                 self.end_headers()
-                self.wfile.write(output.encode())
+                self.wfile.write(body)
             else:
-                self.send_response(404)
+                self.send_not_found()
             return
 
         if path in PATHS_TO_SKIP:
+            self.close_connection = True
+            return
+
+        # Unknown paths never reach the cache, or every typo and scanner probe would get files and a refresh job
+        if path not in KNOWN_PATHS:
+            self.send_not_found()
             return
         
 
         # Handle w/cache
-        current_time = datetime.now()
         hash_key = get_hash_key(path, query_params)
-        file_name = os.path.join(CACHE_DIR, f"cache_{hash_key}.csv")
-        last_req_file = os.path.join(CACHE_DIR, f"last_{hash_key}.json")
+        access_tracker.touch(hash_key)
+
+        # Memory tier first: no disk I/O or file locking for hot keys
+        entry = memory_cache.get(get_entry_key(hash_key, fmt))
+        if entry is None:
+            entry = read_cache_file(hash_key, fmt, path)
+            if entry is not None:
+                memory_cache.put(get_entry_key(hash_key, fmt), entry)
+
+        if entry is None or not is_servable(entry):
+            print(f"Cache for {path} ({fmt}) is outdated or invalid, updating...")
+            formats = record_request(hash_key, path, query_params, fmt)
+            # When this request leads the computation, large outputs go out chunk by chunk as produced
+            stream = ChunkedResponse(self) if fmt == 'csv' and path in STREAMING_PATHS else None
+            entries = refresh_cache_file(path, query_params, formats, stream=stream)
+            # From now on the refresh scheduler keeps this key warm
+            schedule_refresh(hash_key, path, query_params, formats, get_refresh_due(entries['csv']))
+            if stream is not None and stream.started:
+                stream.finish()
+                return
+            if fmt not in entries:
+                # We joined a computation started for other formats, run one that includes ours
+                entries = refresh_cache_file(path, query_params, formats)
+            entry = entries[fmt]
+        elif not is_fresh(entry):
+            # Stale-while-revalidate: answer with what we have, refresh behind the client's back
+            print(f"Cache for {path} is stale, serving it and revalidating in background...")
+            formats = record_request(hash_key, path, query_params, fmt)
+            schedule_refresh(hash_key, path, query_params, formats, time.time())
+
+        if not entry.body:
+            self.send_not_found()
+            return
 
-        try:
-            # Use a context manager to handle the file with the lock
-            with self.get_file_lock(file_name, 'r+') as file:
-                output = file.read()
-                if not output.strip() or (current_time - datetime.fromtimestamp(os.path.getmtime(file_name))) > CACHE_DURATION:
-                    raise ValueError("Cache is outdated or invalid")
-        except (IOError, ValueError):
-            print(f"Cache for {path} is outdated or invalid, updating...")
-            output = handle_request(path, query_params)
-            with self.get_file_lock(file_name, 'w') as file:
-                file.write(output)
-                file.truncate()
-            with open(last_req_file, 'w', encoding='utf-8', errors='replace') as file:
-                json.dump({'path': path, 'query_params': query_params}, file)
-
-        if output:
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
+        if self.is_not_modified(entry):
+            self.send_response(304)
+            self.send_validators(entry, negotiate_encoding(self.headers.get('Accept-Encoding'), entry.variants))
             self.end_headers()
-            self.wfile.write(output.encode())
+            return
+
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding'), entry.variants)
+        body = entry.variants[encoding] if encoding else entry.body
+        self.send_response(200)
+        self.send_header('Content-type', RESPONSE_FORMATS[fmt])
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_validators(entry, encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def send_not_found(self):
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+    def send_validators(self, entry, encoding=None):
+        self.send_header('ETag', entry.variant_etag(encoding))
+        self.send_header('Last-Modified', formatdate(entry.modified, usegmt=True))
+        self.send_header('Vary', 'Accept-Encoding')
+
+
+    def is_not_modified(self, entry):
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            # Every encoding of the entry shares the same content, so any of its tags validates
+            etags = {entry.etag} | {entry.variant_etag(encoding) for encoding in entry.variants}
+            return '*' in tags or bool(tags & etags)
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(entry.modified) <= since
+        return False
+
+
+def get_entry_key(hash_key, fmt):
+    return f"{hash_key}.{fmt}"
+
+
+def get_cache_file_name(hash_key, fmt='csv'):
+    return os.path.join(CACHE_DIR, f"cache_{hash_key}.{fmt}")
+
+
+def get_block_file_name(hash_key):
+    return os.path.join(CACHE_DIR, f"block_{hash_key}.json")
+
+
+def read_block_file(hash_key):
+    try:
+        with open(get_block_file_name(hash_key), 'r', encoding='utf-8', errors='replace') as file:
+            data = json.load(file)
+        return data.get('block'), data.get('tempos') or {}
+    except (IOError, ValueError):
+        return None, {}
+
+
+def get_next_epoch_block(block, netuid, tempo):
+    # Subtensor runs a subnet's epoch on blocks where (block + netuid + 1) % (tempo + 1) == tempo
+    # (blocks_until_next_epoch is 0), data from an epoch block is good until the following one
+    next_epoch = block + tempo - (block + netuid + 1) % (tempo + 1)
+    return next_epoch if next_epoch > block else next_epoch + tempo + 1
+
+
+def set_expiry(entry, path, block=None, tempos=None):
+    """Stamp entry with the block it was computed at and when, in blocks and wall clock, it expires"""
+    policy = CACHE_BLOCK_POLICY.get(path)
+    entry.block = block
+    entry.expires_block = None
+    if policy is not None and block is not None:
+        if policy == 'epoch':
+            if tempos:
+                entry.expires_block = min(get_next_epoch_block(block, int(netuid), int(tempo)) for netuid, tempo in tempos.items())
         else:
-            self.send_response(404)
+            entry.expires_block = block + policy
+
+    if entry.expires_block is not None:
+        lifetime = (entry.expires_block - block) * BLOCK_TIME
+    else:
+        lifetime = CACHE_DURATION.total_seconds()
+    entry.expires_at = entry.created + lifetime
+    entry.ttl = lifetime + CACHE_MAX_STALENESS.total_seconds()
+    return entry
+
+
+def is_fresh(entry):
+    if entry.expires_block is not None:
+        current_block = chain_clock.current_block()
+        if current_block is not None:
+            return current_block < entry.expires_block
+    return time.time() < entry.expires_at
+
+
+def is_servable(entry):
+    # Fresh, or expired for less than the stale-while-revalidate window
+    return time.time() < entry.expires_at + CACHE_MAX_STALENESS.total_seconds()
 
 
-def refresh_cache_file(path, query_params, file_name):
-    output = handle_request(path, query_params)
+def get_request_file_name(hash_key):
+    return os.path.join(CACHE_DIR, f"last_{hash_key}.json")
+
+
+def record_request(hash_key, path, query_params, fmt):
+    """Remember a requested query and its demand in last_<hash>.json and return every format asked for so far"""
+    last_req_file = get_request_file_name(hash_key)
+    formats = {'csv', fmt}
     try:
-        with CommandHandler.get_file_lock(file_name, 'w') as file:
-            file.write(output)
-            file.truncate()  # Ensure to clear any excess if new output is shorter
+        with open(last_req_file, 'r', encoding='utf-8', errors='replace') as file:
+            formats.update(json.load(file).get('formats', []))
+    except (IOError, ValueError):
+        pass
+    formats = sorted(formats)
+    data = {'path': path, 'query_params': query_params, 'formats': formats}
+    stats = access_tracker.stats(hash_key)
+    if stats is not None:
+        data['hits'], data['last_access'] = stats
+    with open(last_req_file, 'w', encoding='utf-8', errors='replace') as file:
+        json.dump(data, file)
+    return formats
+
+
+def read_cache_file(hash_key, fmt='csv', path=None):
+    file_name = get_cache_file_name(hash_key, fmt)
+    try:
+        # Use a context manager to handle the file with the lock
+        with CommandHandler.get_file_lock(file_name, 'r+b') as file:
+            body = file.read()
+            modified_time = os.path.getmtime(file_name)
+    except IOError:
+        return None
+    if not body.strip():
+        return None
+    entry = set_expiry(CacheEntry(body, created=modified_time), path, *read_block_file(hash_key))
+    return add_compressed_variants(entry) if fmt in COMPRESSIBLE_FORMATS else entry
+
+
+def refresh_cache_file(path, query_params, formats=('csv',), stream=None):
+    # Concurrent misses and the background refresher for the same key share a single computation.
+    # Only the caller that ends up running it gets its stream fed, waiters receive the finished entries.
+    hash_key = get_hash_key(path, query_params)
+    return cache_flight.do(hash_key, _refresh_cache_file, path, query_params, hash_key, formats, stream)
+
+
+def _refresh_cache_file(path, query_params, hash_key, formats=('csv',), stream=None):
+    # One computation renders every requested format; CSV always, it is the file freshness is tracked by
+    frames = []
+    keep_frames = any(fmt != 'csv' for fmt in formats)
+    # Endpoints that read the chain tag their frames with the block and subnet tempos they saw
+    started_block = chain_clock.current_block()
+    chain_state = {'block': None, 'tempos': {}}
+
+    def collect(frames_iter):
+        for frame in frames_iter:
+            if not isinstance(frame, str):
+                block = frame.attrs.get('block')
+                if block is not None and (chain_state['block'] is None or block < chain_state['block']):
+                    chain_state['block'] = block
+                chain_state['tempos'].update(frame.attrs.get('tempos', {}))
+            if keep_frames:
+                frames.append(frame)
+            yield frame
+
+    chunks = []
+    if path in KNOWN_PATHS:
+        for chunk in iter_csv(collect(iter_frames(path, query_params))):
+            chunks.append(chunk)
+            if stream is not None:
+                stream.write(chunk)
+    bodies = {'csv': ''.join(chunks).encode()}
+    for fmt in formats:
+        if fmt == 'csv':
+            continue
+        try:
+            bodies[fmt] = serialize_frames(frames, fmt)
+        except Exception as e:
+            print(f"Error rendering {path} as {fmt}: {e}")
+            bodies[fmt] = b''
+
+    block = chain_state['block'] if chain_state['block'] is not None else started_block
+    tempos = {str(netuid): tempo for netuid, tempo in chain_state['tempos'].items()}
+    block_file_name = get_block_file_name(hash_key)
+    try:
+        with open(block_file_name + '.tmp', 'w', encoding='utf-8', errors='replace') as file:
+            json.dump({'block': block, 'tempos': tempos}, file)
+        os.replace(block_file_name + '.tmp', block_file_name)
     except IOError as e:
-        print(f"Error writing to cache file {file_name}: {e}")
+        print(f"Error writing to cache file {block_file_name}: {e}")
 
+    entries = {}
+    for fmt, body in bodies.items():
+        file_name = get_cache_file_name(hash_key, fmt)
+        try:
+            with CommandHandler.get_file_lock(file_name, 'wb') as file:
+                file.write(body)
+                file.truncate()  # Ensure to clear any excess if new output is shorter
+        except IOError as e:
+            print(f"Error writing to cache file {file_name}: {e}")
+        entry = set_expiry(CacheEntry(body), path, block, tempos)
+        if fmt in COMPRESSIBLE_FORMATS:
+            add_compressed_variants(entry)
+        # Identical content keeps its Last-Modified so If-Modified-Since pollers still get 304s
+        previous = memory_cache.get(get_entry_key(hash_key, fmt))
+        if previous is not None and previous.etag == entry.etag:
+            entry.modified = previous.modified
+        # Keep the memory tier in step with the durable tier
+        if entry.body:
+            memory_cache.put(get_entry_key(hash_key, fmt), entry)
+        entries[fmt] = entry
+    return entries
+
+
+def get_refresh_due(entry):
+    # Block expiry is an estimate, if the chain runs slower the key is simply checked again a block later
+    return max(entry.expires_at, time.time() + BLOCK_TIME)
+
+
+def schedule_refresh(hash_key, path, query_params, formats, due):
+    refresh_scheduler.schedule(hash_key, {'path': path, 'query_params': query_params, 'formats': formats}, due)
+
+
+def run_refresh_job(hash_key, job):
+    """Refresh one scheduled key if it has expired and return when it is next due"""
+    path = job['path']
+    query_params = job['query_params']
+    file_name = get_cache_file_name(hash_key)
+
+    demand = access_tracker.demand(hash_key)
+    if demand < REFRESH_MIN_DEMAND:
+        print(f"Cache for {path} {query_params} is no longer requested (demand {demand:.2f}), dropping it...")
+        remove_cache_key(hash_key)
+        return None
+
+    if os.path.exists(file_name):
+        # Freshness follows the same block/epoch policy as request handling
+        probe = set_expiry(CacheEntry(b'', created=os.path.getmtime(file_name)), path, *read_block_file(hash_key))
+        if is_fresh(probe):
+            print(f"Cache for {path} is still fresh, skipping...")
+            return get_refresh_due(probe)
+        print(f"Cache for {path} is outdated, refreshing...")
+    else:
+        print(f"Cache file {file_name} not found, generating new cache...")
 
-def continuously_update_cache():
+    entries = refresh_cache_file(path, query_params, job.get('formats', ['csv']))
+    # Persist demand alongside the query so it survives restarts
+    record_request(hash_key, path, query_params, 'csv')
+    return get_refresh_due(entries['csv'])
+
+
+refresh_scheduler = RefreshScheduler(run_refresh_job, workers=REFRESH_WORKERS, retry_interval=REFRESH_RETRY_INTERVAL)
+
+
+def remove_cache_key(hash_key, file_names=None):
+    """Stop refreshing a key and delete every file and memory entry it owns"""
+    refresh_scheduler.unschedule(hash_key)
+    access_tracker.forget(hash_key)
+    for fmt in RESPONSE_FORMATS:
+        memory_cache.pop(get_entry_key(hash_key, fmt))
+    if file_names is None:
+        file_names = get_cache_files().get(hash_key, [])
+    for file_name in file_names:
+        try:
+            os.remove(file_name)
+        except OSError:
+            pass  # Already gone
+
+
+def get_cache_files():
+    """Group the files in CACHE_DIR by the cache key they belong to"""
+    files = {}
+    for file_name in os.listdir(CACHE_DIR):
+        match = re.match(r'^(?:cache|last|block)_([0-9a-f]{32})\.', file_name)
+        if match:
+            files.setdefault(match.group(1), []).append(os.path.join(CACHE_DIR, file_name))
+    return files
+
+
+def collect_cache_garbage():
+    """Delete files of keys nobody asks for anymore, then lowest-demand keys until under CACHE_DISK_BUDGET"""
+    sizes = {}
+    cache_files = get_cache_files()
+    for hash_key, file_names in cache_files.items():
+        # Orphans: outputs left behind by a query whose last_ file is gone, or keys that lost their demand
+        if get_request_file_name(hash_key) not in file_names or (
+                hash_key not in refresh_scheduler.scheduled_keys() and access_tracker.demand(hash_key) < REFRESH_MIN_DEMAND):
+            remove_cache_key(hash_key, file_names)
+            continue
+        sizes[hash_key] = sum(os.path.getsize(file_name) for file_name in file_names if os.path.exists(file_name))
+
+    total = sum(sizes.values())
+    for hash_key in sorted(sizes, key=access_tracker.demand):
+        if total <= CACHE_DISK_BUDGET:
+            break
+        print(f"Cache directory over budget ({total} bytes), removing {hash_key}...")
+        remove_cache_key(hash_key, cache_files[hash_key])
+        total -= sizes[hash_key]
+
+
+def continuously_collect_cache_garbage():
     while True:
+        time.sleep(CACHE_GC_INTERVAL)
         try:
-            last_files = [f for f in os.listdir(CACHE_DIR) if f.startswith('last_')]
-            for last_file in last_files:
-                last_file_path = os.path.join(CACHE_DIR, last_file)
-                with open(last_file_path, 'r', encoding='utf-8', errors='replace') as file:
-                    data = json.load(file)
-                
-                path = data['path']
-                query_params = data['query_params']
-                hash_key = get_hash_key(path, query_params)
-                file_name = os.path.join(CACHE_DIR, f"cache_{hash_key}.csv")
-
-                try:
-                    # Check if the file exists and its modification time
-                    if os.path.exists(file_name):
-                        file_mod_time = datetime.fromtimestamp(os.path.getmtime(file_name))
-                        current_time = datetime.now()
-
-                        # Update cache if it is outdated
-                        if (current_time - file_mod_time) > CACHE_DURATION:
-                            print(f"Cache for {path} is outdated, refreshing...")
-                            refresh_cache_file(path, query_params, file_name)
-                        else:
-                            print(f"Cache for {path} is still fresh, skipping...")
-                    else:
-                        # If the file does not exist, regenerate it
-                        print(f"Cache file {file_name} not found, generating new cache...")
-                        refresh_cache_file(path, query_params, file_name)
-                except Exception as e:
-                    print(f"Failed to update cache for {path}: {e}")
+            collect_cache_garbage()
+        except Exception as e:
+            print(f"Cache garbage collection failed: {e}")
 
+
+def continuously_update_cache():
+    # Seed the schedule from the queries recorded by previous runs, then dispatch keys as they come due
+    for last_file in [f for f in os.listdir(CACHE_DIR) if f.startswith('last_')]:
+        try:
+            last_req_file = os.path.join(CACHE_DIR, last_file)
+            with open(last_req_file, 'r', encoding='utf-8', errors='replace') as file:
+                data = json.load(file)
+            # Queries recorded before normalization collapse onto their canonical key
+            data['query_params'] = normalize_query(data['path'], data['query_params'])
+            hash_key = get_hash_key(data['path'], data['query_params'])
+            # Files written before demand was tracked count as a single hit when they were last written
+            access_tracker.load(hash_key, data.get('hits', 1.0), data.get('last_access', os.path.getmtime(last_req_file)))
+            if access_tracker.demand(hash_key) < REFRESH_MIN_DEMAND:
+                print(f"Cache for {data['path']} {data['query_params']} is no longer requested, dropping it...")
+                remove_cache_key(hash_key)
+                continue
+            schedule_refresh(hash_key, data['path'], data['query_params'], data.get('formats', ['csv']), time.time())
         except Exception as e:
-            print(f"Error during cache update loop: {e}")
-        time.sleep(CACHE_KEEP_ALIVE_INTERVAL)
+            print(f"Failed to load cached request {last_file}: {e}")
+    refresh_scheduler.run()
 
 
 if __name__ == "__main__":
+    chain_clock.start()
+    chain_state.start()
     threading.Thread(target=continuously_update_cache, daemon=True).start()
+    threading.Thread(target=continuously_collect_cache_garbage, daemon=True).start()
     with Server(("", PORT), CommandHandler) as httpd:
-        print(f"Serving at port {PORT}")
+        print(f"Serving at port {PORT} with {SERVER_WORKERS} workers")
         httpd.serve_forever()
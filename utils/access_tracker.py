@@ -0,0 +1,49 @@
+import threading
+import time
+
+
+class AccessTracker:
+    """Per-key demand: hit count decayed exponentially with age, so both recency and volume count
+
+    A key hit once scores 1.0 and halves every half_life seconds; a key hit 100 times stays above a
+    given threshold for log2(100) ~ 6.6 half-lives longer than a one-off.
+    """
+
+    def __init__(self, half_life):
+        self.half_life = half_life  # seconds
+        self._stats = {}  # key -> [decayed hits at last_access, last_access]
+        self._lock = threading.Lock()
+
+    def touch(self, key, now=None):
+        now = now if now is not None else time.time()
+        with self._lock:
+            hits, last_access = self._stats.get(key, (0.0, now))
+            self._stats[key] = [self._decay(hits, now - last_access) + 1, now]
+
+    def load(self, key, hits, last_access):
+        """Restore persisted stats, keeping whichever side saw the most recent access"""
+        with self._lock:
+            current = self._stats.get(key)
+            if current is None or current[1] < last_access:
+                self._stats[key] = [hits, last_access]
+
+    def stats(self, key):
+        """(decayed hits at last access, last access time), or None for an unknown key"""
+        with self._lock:
+            current = self._stats.get(key)
+            return tuple(current) if current is not None else None
+
+    def demand(self, key, now=None):
+        now = now if now is not None else time.time()
+        with self._lock:
+            current = self._stats.get(key)
+            if current is None:
+                return 0.0
+            return self._decay(current[0], now - current[1])
+
+    def forget(self, key):
+        with self._lock:
+            self._stats.pop(key, None)
+
+    def _decay(self, hits, elapsed):
+        return hits * 0.5 ** (max(elapsed, 0) / self.half_life)
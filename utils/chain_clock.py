@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+class ChainClock:
+    """Tracks the chain head block in a background thread so requests never pay an RPC for it"""
+
+    def __init__(self, subtensor_pool, block_time=12, poll_interval=12):
+        self.subtensor_pool = subtensor_pool
+        self.block_time = block_time
+        self.poll_interval = poll_interval
+        self._block = None
+        self._polled_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chain-clock", daemon=True)
+            self._thread.start()
+        return self
+
+    def observe(self, block):
+        """Record a head block seen elsewhere (e.g. by an endpoint that just queried the chain)"""
+        with self._lock:
+            if self._block is None or block >= self._block:
+                self._block = block
+                self._polled_at = time.time()
+
+    def current_block(self):
+        """Best estimate of the head block: last observed block plus the blocks produced since, or None"""
+        with self._lock:
+            if self._block is None:
+                return None
+            return self._block + int((time.time() - self._polled_at) // self.block_time)
+
+    def _run(self):
+        while True:
+            try:
+                with self.subtensor_pool.connection() as subtensor:
+                    self.observe(subtensor.get_current_block())
+            except Exception as e:
+                print(f"Chain clock failed to read the current block: {e}")
+            time.sleep(self.poll_interval)
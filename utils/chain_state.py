@@ -0,0 +1,161 @@
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+from bittensor.core.chain_data.utils import decode_account_id
+from websockets.sync.client import connect
+
+from utils.subnet_info import little_endian_hex_to_int
+
+# twox128 prefixes of the storage items followed, subnet maps are keyed by the netuid as a little-endian u16
+BLOCK_NUMBER_KEY = "0x26aa394eea5630e07c48ae0c9558cef702a5c1b19ab7a04f536c519aca4983ac"  # System.Number
+TOTAL_NETWORKS_KEY = "0x658faa385070e074c85bf6b568cf05555f3bb7bcd0a076a48abf8c256d221721"
+NETWORKS_ADDED_PREFIX = "0x658faa385070e074c85bf6b568cf05550e30450fc4d507a846032a7fa65d9a43"  # One key per netuid in use
+SUBNET_ITEMS = {
+    'burn': "0x658faa385070e074c85bf6b568cf055501be1755d08418802946bca51b686325",  # Burn
+    'tao_in': "0x658faa385070e074c85bf6b568cf05557a57dce016211512d1700561066b85a3",  # SubnetTAO
+    'alpha_in': "0x658faa385070e074c85bf6b568cf05552ce12f7007574647d692ac7edf8b7a53",  # SubnetAlphaIn
+    'tempo': "0x658faa385070e074c85bf6b568cf05557641384bb339f3758acddfd7053d3317",  # Tempo
+    'immunity_period': "0x658faa385070e074c85bf6b568cf0555b6522cfe03433e9e101a258ee2f580ab",  # ImmunityPeriod
+    'n': "0x658faa385070e074c85bf6b568cf0555a1048e9d244171852dfe8db314dc68ca",  # SubnetworkN
+    'emission': "0x658faa385070e074c85bf6b568cf05554efd2c1e9753037696296e2bfa446095",  # EmissionValues
+    'owner_hotkey': "0x658faa385070e074c85bf6b568cf055568b7553499633fe05caf4d8a51aefe5c",  # SubnetOwnerHotkey
+    'network_registered_at': "0x658faa385070e074c85bf6b568cf0555271d29b9b717ce3d8c571f1cbc180fa2",  # NetworkRegisteredAt
+    'max_validators': "0x658faa385070e074c85bf6b568cf0555741b883d2519eed91857993bfd4df0ba",  # MaxAllowedValidators
+    'difficulty': "0x658faa385070e074c85bf6b568cf05557d15dd66fbf0cbda1d3a651b5e606df2",  # Difficulty
+}
+ACCOUNT_ITEMS = {'owner_hotkey'}  # Decoded to SS58 addresses, every other item is a little-endian integer
+
+
+class ChainState:
+    """Per-subnet chain values kept current by one storage subscription
+
+    A background thread holds a single websocket subscribed to the SUBNET_ITEMS keys of every netuid
+    in use (plus the block number and subnet count), and applies each block's changes to an in-memory
+    table. The tables of the last few blocks are kept, so a reader pinned to a block hash reads exactly
+    that block's values with no RPC. The netuids followed are the NetworksAdded keys, read again
+    whenever the subnet count changes, and the connection is reopened whenever it drops.
+    """
+
+    def __init__(self, subtensor_address, block_time=12, history=16, reconnect_interval=12, max_lag=3):
+        self.url = subtensor_address if "://" in subtensor_address else f"ws://{subtensor_address}"
+        self.block_time = block_time
+        self.reconnect_interval = reconnect_interval
+        self.max_lag = max_lag  # blocks without a notification before the table is no longer trusted as head
+        self._values = {}  # storage key -> raw hex value, current state of every followed key
+        self._history = deque(maxlen=history)  # (block, block_hash, {netuid: {item: value}}), oldest first
+        self._updated_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chain-state", daemon=True)
+            self._thread.start()
+        return self
+
+    def head(self):
+        """(block, block_hash, table) of the newest block, or None while the subscription is not live"""
+        with self._lock:
+            if not self._history or time.time() - self._updated_at > self.max_lag * self.block_time:
+                return None
+            return self._history[-1]
+
+    def at(self, block_hash):
+        """{netuid: {item: value}} as of block_hash, or None if that block is not in the recent history
+
+        A value is None when its key holds no storage, e.g. an ImmunityPeriod never set from its default.
+        """
+        with self._lock:
+            for _, known_hash, table in reversed(self._history):
+                if known_hash == block_hash:
+                    return table
+        return None
+
+    def _run(self):
+        while True:
+            try:
+                self._follow()
+            except Exception as e:
+                print(f"Chain state subscription to {self.url} failed: {e}")
+            time.sleep(self.reconnect_interval)
+
+    def _follow(self):
+        with connect(self.url, max_size=None) as websocket:
+            request_ids = itertools.count(1)
+
+            def request(method, params):
+                request_id = next(request_ids)
+                websocket.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}))
+                while True:
+                    message = json.loads(websocket.recv())
+                    # Notifications arriving meanwhile belong to a subscription being replaced, the new one
+                    # starts with a full snapshot anyway
+                    if message.get("id") == request_id:
+                        if "error" in message:
+                            raise RuntimeError(message["error"])
+                        return message["result"]
+
+            subscription = None
+            while True:
+                if subscription is None:
+                    # Subnet count first, so a subnet added while the netuids are listed shows up as a change
+                    total_networks = request("state_getStorage", [TOTAL_NETWORKS_KEY])
+                    netuids = self._list_netuids(request)
+                    keys = [BLOCK_NUMBER_KEY, TOTAL_NETWORKS_KEY] + [
+                        item_key + netuid.to_bytes(2, 'little').hex() for netuid in netuids for item_key in SUBNET_ITEMS.values()]
+                    with self._lock:
+                        self._values = {}
+                    subscription = request("state_subscribeStorage", [keys])
+
+                message = json.loads(websocket.recv())
+                params = message.get("params") or {}
+                if params.get("subscription") != subscription:
+                    continue
+
+                result = params["result"]
+                with self._lock:
+                    for key, value_hex in result["changes"]:
+                        if value_hex is None:
+                            self._values.pop(key, None)
+                        else:
+                            self._values[key] = value_hex
+                    subnets_changed = self._values.get(TOTAL_NETWORKS_KEY) != total_networks
+
+                if subnets_changed:
+                    # A subnet was added or removed, follow the new netuid set
+                    request("state_unsubscribeStorage", [subscription])
+                    subscription = None
+                    continue
+                self._record(result["block"], netuids)
+
+    def _list_netuids(self, request):
+        netuids = []
+        start_key = None
+        while True:
+            keys = request("state_getKeysPaged", [NETWORKS_ADDED_PREFIX, 1000, start_key])
+            netuids += [int.from_bytes(bytes.fromhex(key[-4:]), 'little') for key in keys]
+            if len(keys) < 1000:
+                return sorted(netuids)
+            start_key = keys[-1]
+
+    def _record(self, block_hash, netuids):
+        with self._lock:
+            table = {}
+            for netuid in netuids:
+                suffix = netuid.to_bytes(2, 'little').hex()
+                values = {}
+                for item, item_key in SUBNET_ITEMS.items():
+                    value_hex = self._values.get(item_key + suffix)
+                    if value_hex is None:
+                        values[item] = None
+                    elif item in ACCOUNT_ITEMS:
+                        values[item] = decode_account_id(bytes.fromhex(value_hex[2:]))
+                    else:
+                        values[item] = little_endian_hex_to_int(value_hex)
+                table[netuid] = values
+            block_hex = self._values.get(BLOCK_NUMBER_KEY)
+            self._history.append((little_endian_hex_to_int(block_hex) if block_hex else None, block_hash, table))
+            self._updated_at = time.time()
@@ -0,0 +1,41 @@
+import pandas as pd
+
+
+def scale_value(value):
+    # Substrate results come back either as plain Python values or wrapped in scale objects
+    return getattr(value, 'value', value)
+
+
+def get_registration_blocks(subtensor, metagraph, netuid, block=None):
+    """BlockAtRegistration of every UID on a subnet as {uid: block}, without a query per UID"""
+    # Metagraphs built from the runtime API already carry it
+    blocks = getattr(metagraph, 'block_at_registration', None)
+    if blocks is not None and len(blocks) == len(metagraph.uids):
+        return {int(uid): int(scale_value(block)) for uid, block in zip(metagraph.uids, blocks)}
+
+    # Otherwise one prefix map over the subnet's (netuid, uid) keys
+    registration_blocks = {}
+    for uid, block in subtensor.query_map_subtensor("BlockAtRegistration", block=block, params=[netuid]):
+        uid = scale_value(uid)
+        if isinstance(uid, (tuple, list)):
+            uid = uid[-1]
+        registration_blocks[int(uid)] = int(scale_value(block))
+    return registration_blocks
+
+
+def get_immunity_period(subtensor, metagraph, netuid, block=None):
+    hparams = getattr(metagraph, 'hparams', None)
+    if getattr(hparams, 'immunity_period', None) is not None:
+        return int(hparams.immunity_period)
+    return int(subtensor.immunity_period(netuid=netuid, block=block))
+
+
+def get_immune_until(subtensor, metagraph, netuid, current_block, block=None):
+    """Block each UID's immunity ends at, NA for UIDs that are not immune (or whose registration is unknown)
+
+    Chain reads the metagraph does not carry are made at block (the head when None).
+    """
+    registration_blocks = get_registration_blocks(subtensor, metagraph, netuid, block)
+    immune_until = pd.Series([registration_blocks.get(int(uid)) for uid in metagraph.uids], dtype='Int64')
+    immune_until += get_immunity_period(subtensor, metagraph, netuid, block)
+    return immune_until.where(immune_until > current_block).array
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheEntry:
+    """Encoded response body plus the time it was produced and its content validators"""
+
+    def __init__(self, body, created=None, modified=None, ttl=None):
+        self.body = body
+        self.created = created if created is not None else time.time()
+        self.ttl = ttl  # seconds the memory tier may hold it, None for the cache-wide ttl
+        # Freshness, stamped by the owner of the cache: chain block it was computed at,
+        # block it expires at (None when expiry is wall-clock only) and estimated wall-clock expiry
+        self.block = None
+        self.expires_block = None
+        self.expires_at = None
+        # When the content last changed, which outlives refreshes that produce identical bytes
+        self.modified = modified if modified is not None else self.created
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.variants = {}  # Content-Encoding -> pre-compressed body
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(variant) for variant in self.variants.values())
+
+    def variant_etag(self, encoding):
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def age(self, now=None):
+        return (now if now is not None else time.time()) - self.created
+
+
+class MemoryCache:
+    """Thread-safe LRU of CacheEntry objects bounded by total body bytes and entry age"""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # seconds
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the entry for key and mark it most recently used, or None if missing/expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.age() > (entry.ttl if entry.ttl is not None else self.ttl):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        """Insert or replace an entry, evicting least recently used ones to stay under max_bytes"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            # Never keep a single entry that would blow the whole budget
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.total_bytes += entry.size
+            while self.total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,82 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RefreshScheduler:
+    """Runs a refresh callable per key at its due time, ordered by a heap and executed on a bounded pool
+
+    refresh(key, job) does the work and returns the next due time (epoch seconds), or None to stop
+    refreshing that key.
+    """
+
+    def __init__(self, refresh, workers=4, retry_interval=60):
+        self.refresh = refresh
+        self.retry_interval = retry_interval
+        self._heap = []  # (due, key), superseded items are skipped lazily
+        self._due = {}  # key -> due time of its live heap item
+        self._jobs = {}  # key -> latest job data
+        self._running = set()
+        self._cond = threading.Condition()  # RLock-backed, so schedule() can be called with it held
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refresh")
+
+    def schedule(self, key, job, due):
+        """Refresh key at due, or keep its current slot if that is sooner"""
+        with self._cond:
+            self._jobs[key] = job
+            if key in self._running:
+                return  # It reschedules itself when done
+            if key in self._due and self._due[key] <= due:
+                return
+            self._due[key] = due
+            heapq.heappush(self._heap, (due, key))
+            self._cond.notify()
+
+    def unschedule(self, key):
+        with self._cond:
+            self._due.pop(key, None)
+            self._jobs.pop(key, None)
+
+    def scheduled_keys(self):
+        with self._cond:
+            return set(self._jobs)
+
+    def run(self):
+        """Dispatch due keys to the worker pool forever, sleeping until the next deadline"""
+        while True:
+            with self._cond:
+                key = self._wait_for_due_key()
+                del self._due[key]
+                self._running.add(key)
+                job = self._jobs[key]
+            self._executor.submit(self._run_job, key, job)
+
+    def _wait_for_due_key(self):
+        while True:
+            # Drop heap items that were superseded by an earlier slot or unscheduled
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._cond.wait()
+                continue
+            due, key = self._heap[0]
+            delay = due - time.time()
+            if delay <= 0:
+                heapq.heappop(self._heap)
+                return key
+            self._cond.wait(delay)
+
+    def _run_job(self, key, job):
+        try:
+            next_due = self.refresh(key, job)
+        except Exception as e:
+            print(f"Failed to refresh {key}: {e}")
+            next_due = time.time() + self.retry_interval
+        with self._cond:
+            self._running.discard(key)
+            # Unscheduled while running: let it go
+            if next_due is None or key not in self._jobs:
+                self._jobs.pop(key, None)
+                return
+            self.schedule(key, self._jobs[key], next_due)
@@ -1,9 +1,19 @@
 import bittensor as bt
 import pandas as pd
-import websockets
-import asyncio
-import json
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+HYPERPARAMS_TTL = 600  # Seconds the bulk subnet hyperparameters are reused before being read again
+SUBNET_INFO_CONCURRENCY = 3  # Bulk reads of one subnet list run side by side, each on its own pooled connection
+
+# netuid -> (network_registered_at, {'max_n', 'difficulty'}), shared by every caller in the process
+_hyperparams = {}
+_hyperparams_loaded_at = 0
+_hyperparams_lock = threading.Lock()
+# Netuids seen by the last subnet list, lets the Burn batch start before all_subnets() has answered
+_known_netuids = []
+_read_executor = ThreadPoolExecutor(max_workers=SUBNET_INFO_CONCURRENCY, thread_name_prefix="subnet-info")
 
 def little_endian_hex_to_int(hex_str):
     # Remove '0x' prefix if present
@@ -19,109 +29,203 @@ def little_endian_hex_to_int(hex_str):
     # Convert bytes to integer
     return int.from_bytes(reversed_bytes, byteorder='big')
 
-async def get_burn_regs(netuid, ws):
-    subnet_hex = hex(netuid)[2:].zfill(2)
-    await ws.send(json.dumps(
-        {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "state_subscribeStorage",
-            "params": [[f"0x658faa385070e074c85bf6b568cf055501be1755d08418802946bca51b686325{subnet_hex}00"]],
-        }
-    ))
-    # Ignore the first confirmation response
-    await ws.recv()
-    response = await ws.recv()
-    full_response = json.loads(response)
-    changes_list = full_response["params"]["result"]["changes"]
-
-    # Extract and convert the little-endian hex value to an integer
-    for changes in changes_list:
-        key_hex, value_hex = changes
-        int_value = little_endian_hex_to_int(value_hex)
-        return int_value
-
-async def fetch_subnet_info(subtensor_address, netuids=None):
-    chain_endpoint = f"{subtensor_address}"
-    subtensor = None
-    ws = None
+def burn_storage_key(netuid):
+    # twox128("SubtensorModule") + twox128("Burn") + the netuid as a little-endian u16
+    return f"0x658faa385070e074c85bf6b568cf055501be1755d08418802946bca51b686325{netuid.to_bytes(2, 'little').hex()}"
+
+def get_burn_regs(netuid, subtensor):
+    # Raw storage read over the subtensor's own websocket, no extra connection per call
+    response = subtensor.substrate.rpc_request("state_getStorage", [burn_storage_key(netuid)])
+    value_hex = response.get("result")
+    if value_hex is None:
+        return None
+
+    # Convert the little-endian hex value to an integer
+    return little_endian_hex_to_int(value_hex)
+
+def get_all_burn_regs(netuids, subtensor, block_hash=None):
+    """Burn of every netuid as {netuid: rao} in a single state_queryStorageAt round trip at block_hash"""
+    keys = {burn_storage_key(netuid): netuid for netuid in netuids}
+    if not keys:
+        return {}
+    response = subtensor.substrate.rpc_request("state_queryStorageAt", [list(keys), block_hash])
+    burns = dict.fromkeys(netuids)
+    # One change set for the queried block, listing [key, value] for every key (value None if unset)
+    for change_set in response.get("result") or []:
+        for key, value_hex in change_set.get("changes", []):
+            if value_hex is not None and key in keys:
+                burns[keys[key]] = little_endian_hex_to_int(value_hex)
+    return burns
+
+def hyperparams_expired():
+    return time.time() - _hyperparams_loaded_at > HYPERPARAMS_TTL
+
+def get_all_subnet_hyperparams(read_subnets_info, registered_at, subnets_info=None):
+    """max_n and difficulty of every subnet in registered_at ({netuid: network_registered_at}), from one get_all_subnets_info() runtime call
+
+    Hyperparameters rarely change, so the result is kept for HYPERPARAMS_TTL. It is reloaded early
+    when a subnet is missing or was registered again since (its network_registered_at moved), as
+    a new owner starts from fresh hyperparameters. read_subnets_info() returns get_all_subnets_info()
+    and is only called for a reload, unless the caller already read it (subnets_info), so a warm
+    cache needs no connection at all.
+    """
+    global _hyperparams_loaded_at
+    with _hyperparams_lock:
+        stale = hyperparams_expired() or any(
+            _hyperparams.get(netuid, (None,))[0] != block for netuid, block in registered_at.items())
+        if stale:
+            if subnets_info is None:
+                subnets_info = read_subnets_info()
+            _hyperparams.clear()
+            for subnet_info in subnets_info:
+                _hyperparams[subnet_info.netuid] = (registered_at.get(subnet_info.netuid), {
+                    'max_n': subnet_info.max_allowed_validators,
+                    'difficulty': subnet_info.difficulty,
+                })
+            _hyperparams_loaded_at = time.time()
+        return {netuid: _hyperparams[netuid][1] for netuid in registered_at if netuid in _hyperparams}
+
+def fetch_subnet_info(subtensor_address, netuids=None, subtensor=None, subtensor_pool=None, chain_state=None):
+    # With a pool the independent bulk reads overlap, each on a connection of its own. A single
+    # connection passed in is used as is, one read after the other, and left open. While a
+    # chain_state (utils.chain_state.ChainState) is live the rows come from its table, with no RPC.
+    global _known_netuids
+    owns_subtensor = subtensor is None and subtensor_pool is None and (chain_state is None or chain_state.head() is None)
+
+    def read(fn, *args):
+        if subtensor_pool is None:
+            return fn(subtensor, *args)
+        with subtensor_pool.connection() as pooled_subtensor:
+            return fn(pooled_subtensor, *args)
+
+    def start(fn, *args):
+        if subtensor_pool is not None:
+            return _read_executor.submit(read, fn, *args)
+        future = Future()
+        try:
+            future.set_result(read(fn, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
     try:
         # Initialize the Subtensor connection
-        subtensor = bt.subtensor(network=f"{subtensor_address}")
+        if owns_subtensor:
+            subtensor = bt.subtensor(network=f"{subtensor_address}")
 
         # Initialize a list to collect subnet data
         subnets_data = []
 
-        # Get all subnets info using the new method
-        all_subnets = subtensor.all_subnets()
-        all_sn_dynamic_info = {info.netuid: info for info in all_subnets}
+        if isinstance(netuids, int):
+            netuids = [netuids]
+        elif isinstance(netuids, (list, tuple, set)):
+            netuids = list(netuids)
+        elif netuids is not None:
+            raise ValueError("netuid must be an int, list, tuple, set, or None")
+
+        # Every value below is read at this one block, so the rows describe the same chain state.
+        # Per subnet: n, tempo, emission, owner_hotkey, network_registered_at, tao_in, alpha_in (TAO),
+        # burn (rao), max_n and difficulty (None when they come from the hyperparameter cache)
+        head = chain_state.head() if chain_state is not None else None
+        if head is not None:
+            block, block_hash, table = head
+            records = {netuid: {
+                'n': values['n'] or 0,
+                'tempo': values['tempo'],
+                'emission': (values['emission'] or 0) / 1e9,
+                'owner_hotkey': values['owner_hotkey'],
+                'network_registered_at': values['network_registered_at'],
+                'tao_in': (values['tao_in'] or 0) / 1e9,
+                'alpha_in': (values['alpha_in'] or 0) / 1e9,
+                'burn': values['burn'],
+                'max_n': values['max_validators'],
+                'difficulty': values['difficulty'],
+            } for netuid, values in table.items()}
+            subnets_info_future = None
+        else:
+            def pin_block(s):
+                current_block = s.get_current_block()
+                return current_block, s.get_block_hash(current_block)
+            block, block_hash = read(pin_block)
+
+            # The Burn batch and an expired hyperparameter load do not depend on all_subnets(), so they are
+            # sent together with it. Burn keys are guessed from the last list, new subnets are read after.
+            subnets_future = start(lambda s: s.all_subnets(block=block))
+            burn_netuids = netuids if netuids is not None else _known_netuids
+            burns_future = start(lambda s: get_all_burn_regs(burn_netuids, s, block_hash))
+            subnets_info_future = start(lambda s: s.get_all_subnets_info(block=block)) if hyperparams_expired() else None
+
+            # Get all subnets info using the new method
+            all_sn_dynamic_info = {info.netuid: info for info in subnets_future.result() if info is not None}
+            _known_netuids = sorted(all_sn_dynamic_info)
+
+            # get the recycle/burn of every subnet, plus any subnet the batch did not guess
+            burns = burns_future.result()
+            if missing := [netuid for netuid in all_sn_dynamic_info if netuid not in burns]:
+                burns.update(read(lambda s: get_all_burn_regs(missing, s, block_hash)))
+            records = {netuid: {
+                'n': info.k,  # k represents the current number of nodes
+                'tempo': info.tempo,
+                'emission': info.emission.tao,
+                'owner_hotkey': info.owner_hotkey,
+                'network_registered_at': info.network_registered_at,
+                'tao_in': info.tao_in.tao,
+                'alpha_in': info.alpha_in.tao,
+                'burn': burns[netuid],
+                'max_n': None,
+                'difficulty': None,
+            } for netuid, info in all_sn_dynamic_info.items()}
+
+        # Each subnet's share of the network emission, normalized over every subnet (not only the
+        # requested ones) in one vectorized pass, no metagraph needed
+        emissions = pd.Series({netuid: record['emission'] for netuid, record in records.items()}, dtype='float64')
+        total_emission = emissions.sum()
+        weights = emissions / total_emission if total_emission > 0 else emissions * 0
+
+        # max_n and difficulty the subscription does not carry come from the process-wide bulk cache
+        if any(record['max_n'] is None or record['difficulty'] is None for record in records.values()):
+            subnets_info = subnets_info_future.result() if subnets_info_future is not None else None
+            registered_at = {netuid: record['network_registered_at'] for netuid, record in records.items()}
+            hyperparams = get_all_subnet_hyperparams(lambda: read(lambda s: s.get_all_subnets_info(block=block)), registered_at, subnets_info)
+            for netuid, record in records.items():
+                for name in ('max_n', 'difficulty'):
+                    if record[name] is None:
+                        record[name] = hyperparams.get(netuid, {}).get(name)
         
         # If netuid is provided, filter to only those netuids
         if netuids is not None:
-            if isinstance(netuids, int):
-                netuids = [netuids]
-            elif isinstance(netuids, (list, tuple, set)):
-                netuids = list(netuids)
-            else:
-                raise ValueError("netuid must be an int, list, tuple, set, or None")
-            if not (filtered := {n: all_sn_dynamic_info[n] for n in netuids if n in all_sn_dynamic_info}):
+            if not (records := {n: records[n] for n in netuids if n in records}):
                 return pd.DataFrame()
-            all_sn_dynamic_info = filtered
-        
-        # Calculate total emission value across all subnets
-        total_emission = 1
-
-        # Establish websocket connection once
-        ws = await websockets.connect(chain_endpoint, ping_interval=None)
-
-        for netuid, subnet in all_sn_dynamic_info.items():
-            if subnet is None:
-                continue
-                
-            # Get emission value for this subnet using metagraph
-            metagraph = subtensor.metagraph(netuid=netuid)
-            emission_value = float(metagraph.emission.sum())
-            emission_pct = (emission_value / total_emission * 100) if total_emission > 0 else 0
-            
-            # Get subnet info for max_n and difficulty
-            subnet_hyperparams = subtensor.get_subnet_hyperparameters(netuid)
-
-            # get the recycle/burn
-            #time.sleep(2) # temporary to avoid 429 on finney
-            burn = await get_burn_regs(netuid, ws)
-            
+
+        for netuid, record in records.items():
+            burn = record['burn']
             data = {
-                'NETUID': subnet.netuid,
-                'N': subnet.k,  # k represents the current number of nodes
-                'MAX_N': subnet_hyperparams.max_validators,  # Get max_validators from hyperparameters
-                'EMISSION': f"{emission_pct:.2f}%",
-                'TEMPO': subnet.tempo,
-                'BURN': bt.Balance.__float__(bt.Balance(burn)), # type: ignore
-                'POW': subnet_hyperparams.difficulty,
-                'SUDO': 'Root' if subnet.owner_hotkey == '5GrwvaEF5zXb26Fz9rcQpDWS57CtERHpNehXCPcNoHGKutQY' else 'None',
-                'WEIGHT': emission_pct / 100 if total_emission > 0 else 0,
-                'ALPHA_PRICE': subnet.tao_in.tao / subnet.alpha_in.tao if hasattr(subnet, 'tao_in') and hasattr(subnet, 'alpha_in') else 0.0,
+                'NETUID': netuid,
+                'N': record['n'],
+                'MAX_N': record['max_n'],  # MaxAllowedValidators
+                'EMISSION': f"{weights[netuid] * 100:.2f}%",
+                'TEMPO': record['tempo'],
+                'BURN': bt.Balance.__float__(bt.Balance(burn)) if burn is not None else None, # type: ignore
+                'POW': record['difficulty'],
+                'SUDO': 'Root' if record['owner_hotkey'] == '5GrwvaEF5zXb26Fz9rcQpDWS57CtERHpNehXCPcNoHGKutQY' else 'None',
+                'WEIGHT': float(weights[netuid]),
+                'ALPHA_PRICE': record['tao_in'] / record['alpha_in'] if record['alpha_in'] else 0.0,
             }
             subnets_data.append(data)
 
         subnet_df = pd.DataFrame(subnets_data)
-        # Sort by emission value descending
-        subnet_df = subnet_df.sort_values('EMISSION', ascending=False)
+        # Sort by emission value descending, on the numeric share as the EMISSION strings would sort "9.00%" above "10.00%"
+        subnet_df = subnet_df.sort_values('WEIGHT', ascending=False)
         return subnet_df
     finally:
-        if ws is not None:
-            try:
-                await ws.close()
-            except:
-                pass  # Ignore any errors during close
-        if subtensor and hasattr(subtensor, 'close'):
+        if owns_subtensor and subtensor and hasattr(subtensor, 'close'):
             try:
                 subtensor.close()
             except:
                 pass  # Ignore any errors during close
 
-def get_subnet_info(subtensor_address, netuids=None):
-    return asyncio.run(fetch_subnet_info(subtensor_address, netuids=netuids))
+def get_subnet_info(subtensor_address, netuids=None, subtensor=None, subtensor_pool=None, chain_state=None):
+    return fetch_subnet_info(subtensor_address, netuids=netuids, subtensor=subtensor, subtensor_pool=subtensor_pool, chain_state=chain_state)
 
 if __name__ == "__main__":
     # Define the Subtensor network address
@@ -0,0 +1,110 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import bittensor as bt
+
+
+class SubtensorPool:
+    """Long-lived subtensor connections lent to one caller at a time
+
+    Opening a subtensor costs a websocket handshake plus a runtime metadata load, so connections are
+    kept open and reused. Idle connections are health-checked before being lent out again and any
+    connection that fails is closed and replaced on the next acquire.
+    """
+
+    def __init__(self, network, size=4, health_check_interval=30, acquire_timeout=60):
+        self.network = network
+        self.size = size
+        self.health_check_interval = health_check_interval  # seconds idle before a connection is re-checked
+        self.acquire_timeout = acquire_timeout  # seconds a caller waits for a connection unless it passes its own
+        self._idle = []  # (subtensor, released_at), most recently used last
+        self._open = 0
+        self._cond = threading.Condition()  # Signalled whenever a connection is returned or a slot frees up
+
+    def acquire(self, timeout=None):
+        """Return a healthy connection, opening one if the pool has room or waiting for one otherwise
+
+        Raises TimeoutError if none became available within timeout (default acquire_timeout) seconds.
+        """
+        timeout = timeout if timeout is not None else self.acquire_timeout
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            with self._cond:
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.time() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"No subtensor connection to {self.network} available within {timeout}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    subtensor, released_at = self._idle.pop()
+                else:
+                    self._open += 1
+                    subtensor = None
+            if subtensor is None:
+                return self._connect()
+
+            if time.time() - released_at < self.health_check_interval or self._is_healthy(subtensor):
+                return subtensor
+            print(f"Subtensor connection to {self.network} is unhealthy, reconnecting...")
+            self._discard(subtensor)
+
+    def release(self, subtensor, healthy=True):
+        """Hand a connection back, or close it if the caller saw it fail"""
+        if subtensor is None:
+            return
+        if healthy or self._is_healthy(subtensor):
+            with self._cond:
+                self._idle.append((subtensor, time.time()))
+                self._cond.notify()
+        else:
+            self._discard(subtensor)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        subtensor = self.acquire(timeout)
+        healthy = True
+        try:
+            yield subtensor
+        except Exception:
+            # The error may be the query's or the socket's, release() tells them apart
+            healthy = False
+            raise
+        finally:
+            self.release(subtensor, healthy)
+
+    def close(self):
+        while True:
+            with self._cond:
+                if not self._idle:
+                    return
+                subtensor, _ = self._idle.pop()
+            self._discard(subtensor)
+
+    def _connect(self):
+        try:
+            return bt.subtensor(network=self.network)
+        except Exception:
+            self._free_slot()
+            raise
+
+    def _is_healthy(self, subtensor):
+        try:
+            subtensor.get_current_block()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, subtensor):
+        self._free_slot()
+        if hasattr(subtensor, 'close'):
+            try:
+                subtensor.close()
+            except:
+                pass  # Ignore any errors during close
+
+    def _free_slot(self):
+        # A waiter can now open a replacement connection
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()